@@ -0,0 +1,271 @@
+import math
+from typing import TypedDict
+
+import numpy as np
+import pandas as pd
+from numba import njit
+
+
+class Position:
+    LONG = "LONG"
+    SHORT = "SHORT"
+    UNKNOWN = "UNKNOWN"
+
+
+class Entry(TypedDict):
+    open: float
+    close: float
+    posicao: str
+
+
+SEM_POSICAO = 0
+CODIGO_LONG = 1
+CODIGO_SHORT = 2
+
+
+def get_amount_of_shares(balance: float, open: float):
+    shares = math.floor(balance / open)
+    invested_value = shares * open
+    return shares, invested_value
+
+
+class EstadoBacktest(TypedDict):
+    data: str
+    linhas: int
+    valor_inicial: float
+    saldo: float
+    investido: float
+    acoes: int
+    posicao: str | None
+    buy_and_hold: float
+
+
+CODIGOS = {Position.LONG: CODIGO_LONG, Position.SHORT: CODIGO_SHORT}
+POSICOES = {CODIGO_LONG: Position.LONG, CODIGO_SHORT: Position.SHORT}
+
+
+def codificar_posicoes(
+    posicao: pd.Series, posicao_inicial: int | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Codifica a coluna `posicao` em dois vetores de inteiros:
+
+    - o sinal bruto do dia (LONG, SHORT ou sem posição);
+    - a posição vigente ao final do dia, propagada (ffill) a partir dos sinais
+      diferentes de UNKNOWN. Sem `posicao_inicial`, a posição vigente do
+      primeiro dia é o seu sinal bruto; com ela, o backtest continua de um
+      estado salvo e essa é a posição vigente antes do primeiro dia."""
+
+    bruto = np.select(
+        [
+            posicao.eq(Position.LONG).to_numpy(dtype=bool),
+            posicao.eq(Position.SHORT).to_numpy(dtype=bool),
+        ],
+        [CODIGO_LONG, CODIGO_SHORT],
+        SEM_POSICAO,
+    )
+
+    # Como no loop original: sinais nulos, vazios ou UNKNOWN mantêm a posição.
+    texto = posicao.astype("string")
+    atualiza = (texto.notna() & (texto != "") & (texto != Position.UNKNOWN)).to_numpy(
+        dtype=bool, na_value=False
+    )
+    texto = texto.str.strip()
+    codigo = np.select(
+        [
+            texto.eq(Position.LONG).to_numpy(dtype=bool, na_value=False),
+            texto.eq(Position.SHORT).to_numpy(dtype=bool, na_value=False),
+        ],
+        [CODIGO_LONG, CODIGO_SHORT],
+        SEM_POSICAO,
+    ).astype(np.float64)
+
+    codigo[~atualiza] = np.nan
+    if posicao_inicial is None:
+        codigo[0] = bruto[0]
+    vigente = pd.Series(codigo).ffill().fillna(posicao_inicial or SEM_POSICAO)
+    return bruto, vigente.to_numpy(dtype=np.int64)
+
+
+@njit(cache=True)
+def _simular_carteira(
+    abertura, retorno, long_anterior, venda, compra, inicio, saldo, investido, acoes
+):
+    """Evolui saldo e valor investido dia a dia a partir da linha `inicio`.
+    Apenas as compras dependem do caminho percorrido (quantidade de ações
+    sobre o saldo disponível), por isso este trecho é compilado em vez de
+    vetorizado."""
+
+    n = abertura.shape[0]
+    dinheiro = np.empty(n)
+    if inicio > 0:
+        dinheiro[0] = saldo + investido
+
+    for i in range(inicio, n):
+        if long_anterior[i]:
+            investido = investido * retorno[i]
+
+        if venda[i]:
+            saldo += investido
+            investido = 0.0
+            acoes = 0
+
+        if compra[i]:
+            acoes = math.floor(saldo / abertura[i])
+            investido = acoes * abertura[i]
+            saldo -= investido
+
+        dinheiro[i] = saldo + investido
+
+    return dinheiro, saldo, investido, acoes
+
+
+def executar_backtest(
+    df: pd.DataFrame, valor_inicial: float, estado: EstadoBacktest | None = None
+):
+    """Executa o backtest da estratégia em `df` (colunas open, close e posicao).
+
+    Adiciona as colunas dinheiro, bnh, mudanca e retornos ao próprio `df` e
+    retorna a tupla (df, valor_final, buy_and_hold, estado_final). Quando
+    `estado` é informado, `df` contém apenas os dias seguintes ao estado salvo
+    e o backtest continua de onde parou."""
+
+    abertura = df["open"].to_numpy(dtype=np.float64)
+    fechamento = df["close"].to_numpy(dtype=np.float64)
+    retorno = abertura / fechamento
+
+    posicao_inicial = CODIGOS.get(estado["posicao"]) if estado else None
+    bruto, vigente = codificar_posicoes(df["posicao"], posicao_inicial)
+    anterior = np.empty_like(vigente)
+    anterior[0] = vigente[0] if estado is None else posicao_inicial or SEM_POSICAO
+    anterior[1:] = vigente[:-1]
+
+    venda = (bruto == CODIGO_SHORT) & (anterior == CODIGO_LONG)
+    compra = (bruto == CODIGO_LONG) & (anterior == CODIGO_SHORT)
+
+    fatores = retorno.copy()
+    if estado is None:
+        venda[0] = compra[0] = False
+        acoes, investido = 0, 0.0
+        if bruto[0] == CODIGO_LONG:
+            acoes, investido = get_amount_of_shares(valor_inicial, abertura[0])
+        saldo = valor_inicial - investido
+        fatores[0] = saldo + investido
+        inicio = 1
+    else:
+        valor_inicial = estado["valor_inicial"]
+        saldo, investido, acoes = estado["saldo"], estado["investido"], estado["acoes"]
+        fatores[0] = estado["buy_and_hold"] * retorno[0]
+        inicio = 0
+
+    dinheiro, saldo, investido, acoes = _simular_carteira(
+        abertura,
+        retorno,
+        anterior == CODIGO_LONG,
+        venda,
+        compra,
+        inicio,
+        float(saldo),
+        float(investido),
+        int(acoes),
+    )
+    bnh = np.cumprod(fatores)
+
+    mudanca = np.full(len(df), None, dtype=object)
+    if estado is None:
+        mudanca[0] = df["posicao"].iloc[0]
+    mudanca[venda] = Position.SHORT
+    mudanca[compra] = Position.LONG
+
+    retornos = dinheiro / valor_inicial - 1
+    if estado is None:
+        retornos[0] = 0
+
+    df["dinheiro"] = dinheiro
+    df["bnh"] = bnh
+    df["mudanca"] = mudanca
+    df["retornos"] = 100 * retornos
+
+    estado_final = EstadoBacktest(
+        data=str(df["date"].iloc[-1]),
+        linhas=len(df) + (estado["linhas"] if estado else 0),
+        valor_inicial=valor_inicial,
+        saldo=saldo,
+        investido=investido,
+        acoes=acoes,
+        posicao=POSICOES.get(int(vigente[-1])),
+        buy_and_hold=bnh[-1],
+    )
+    return df, dinheiro[-1], bnh[-1], estado_final
+
+
+def executar_backtest_iterativo(df: pd.DataFrame, valor_inicial: float):
+    """Implementação original, linha a linha. Mantida como referência para
+    conferir os resultados de `executar_backtest`."""
+
+    data: list[Entry] = df.to_dict("records")
+    balance = valor_inicial
+
+    first_day = data[0]
+    current_position = first_day["posicao"]
+    current_shares, invested_value = (
+        get_amount_of_shares(balance, first_day["open"])
+        if current_position == "LONG"
+        else (0, 0)
+    )
+
+    balance -= invested_value
+
+    buy_n_hold = balance + invested_value
+    dinheiro = []
+    bnh = []
+    retornos = [0]
+    mudanca = [current_position]
+    posicoes = [current_position]
+
+    dinheiro.append(balance + invested_value)
+    bnh.append(buy_n_hold)
+
+    for entry in data[1:]:
+        todays_return = entry["open"] / entry["close"]
+        buy_n_hold = buy_n_hold * todays_return
+        mudanca_posicao = None
+
+        if current_position == Position.LONG:
+            invested_value = invested_value * todays_return
+
+        if entry["posicao"] == Position.SHORT and current_position in [Position.LONG]:
+            balance += invested_value
+            invested_value = 0
+            current_shares = 0
+            mudanca_posicao = entry["posicao"]
+
+        if entry["posicao"] == Position.LONG and current_position in [
+            Position.SHORT,
+        ]:
+            current_shares, invested_value = get_amount_of_shares(
+                balance, entry["open"]
+            )
+            balance -= invested_value
+            mudanca_posicao = entry["posicao"]
+
+        dinheiro.append(balance + invested_value)
+        bnh.append(buy_n_hold)
+        mudanca.append(mudanca_posicao)
+
+        retornos.append((dinheiro[-1] / valor_inicial) - 1)
+
+        nova_posicao = entry.get("posicao")
+        if isinstance(nova_posicao, str) and nova_posicao:
+            if nova_posicao != Position.UNKNOWN:
+                current_position = entry["posicao"].strip()
+        posicoes.append(current_position)
+
+    balance += invested_value
+
+    df["dinheiro"] = dinheiro
+    df["bnh"] = bnh
+    df["mudanca"] = mudanca
+    df["retornos"] = retornos
+    df["retornos"] = 100 * df["retornos"]
+
+    return df, balance, buy_n_hold
@@ -0,0 +1,109 @@
+import hashlib
+import json
+from typing import Iterable
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from config import MODELO, SYSTEM_PROMPT, SYSTEM_PROMPT_MULTI, USER_PROMPT
+from database import RespostaCache, criar_tabelas, sqlite_engine
+from tokens import truncar
+
+# Quantidade de chaves por consulta, abaixo do limite de variáveis do SQLite.
+TAMANHO_CONSULTA = 500
+
+
+def get_system_prompt(ticker: str) -> str:
+    return SYSTEM_PROMPT.format(ticker=ticker)
+
+
+def get_system_prompt_multi(tickers: list[str]) -> str:
+    return SYSTEM_PROMPT_MULTI.format(tickers=", ".join(tickers))
+
+
+def get_tickers_prompt_multi(system_prompt: str) -> list[str] | None:
+    """Tickers de um system prompt multi-ticker, ou None se ele não segue o
+    SYSTEM_PROMPT_MULTI atual."""
+    prefixo, sufixo = SYSTEM_PROMPT_MULTI.split("{tickers}")
+    if not (system_prompt.startswith(prefixo) and system_prompt.endswith(sufixo)):
+        return None
+    return system_prompt[len(prefixo) : len(system_prompt) - len(sufixo)].split(", ")
+
+
+def get_user_prompt(data, titulo: str) -> str:
+    return get_user_prompts([data], [titulo])[0]
+
+
+def get_user_prompts(datas: Iterable, titulos: Iterable[str]) -> list[str]:
+    """User prompts das notícias, com o texto cortado em MAX_TOKENS_NOTICIA."""
+    titulos = truncar(titulo.strip() for titulo in titulos)
+    return [
+        USER_PROMPT.format(data=data, noticia=titulo)
+        for data, titulo in zip(datas, titulos)
+    ]
+
+
+def get_chave(modelo: str, system_prompt: str, user_prompt: str) -> str:
+    """Hash da requisição: duas requisições com a mesma chave têm a mesma resposta."""
+    conteudo = json.dumps([modelo, system_prompt, user_prompt], ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+def get_chaves_noticias(ticker: str, df: pd.DataFrame, modelo: str = MODELO):
+    """Chaves das requisições de batch de cada notícia (colunas date e title)."""
+    system_prompt = get_system_prompt(ticker)
+    return [
+        get_chave(modelo, system_prompt, user_prompt)
+        for user_prompt in get_user_prompts(df["date"], df["title"])
+    ]
+
+
+class CacheLLM:
+    """Cache persistente das respostas do LLM, no mesmo banco dos BatchLogs."""
+
+    def __init__(self):
+        criar_tabelas()
+
+    def obter(self, chaves: Iterable[str]) -> pd.DataFrame:
+        """Retorna as respostas em cache (colunas chave, decisao, motivo)."""
+        chaves = list(dict.fromkeys(chaves))
+        linhas = []
+        with Session(sqlite_engine) as session:
+            for inicio in range(0, len(chaves), TAMANHO_CONSULTA):
+                stmt = select(
+                    RespostaCache.chave, RespostaCache.decisao, RespostaCache.motivo
+                ).where(
+                    RespostaCache.chave.in_(chaves[inicio : inicio + TAMANHO_CONSULTA])
+                )
+                linhas.extend(session.execute(stmt).all())
+
+        return pd.DataFrame(linhas, columns=["chave", "decisao", "motivo"])
+
+    def salvar(self, respostas: pd.DataFrame, modelo: str = MODELO):
+        """Salva as respostas (colunas chave, decisao, motivo), sobrescrevendo
+        as chaves já existentes."""
+        registros = (
+            respostas[["chave", "decisao", "motivo"]]
+            .drop_duplicates("chave", keep="last")
+            .assign(modelo=modelo)
+            .to_dict("records")
+        )
+        if not registros:
+            return
+
+        with Session(sqlite_engine) as session:
+            for inicio in range(0, len(registros), TAMANHO_CONSULTA):
+                stmt = insert(RespostaCache).values(
+                    registros[inicio : inicio + TAMANHO_CONSULTA]
+                )
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[RespostaCache.chave],
+                    set_={
+                        "decisao": stmt.excluded.decisao,
+                        "motivo": stmt.excluded.motivo,
+                    },
+                )
+                session.execute(stmt)
+            session.commit()
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import random
+import re
+import time
+
+import pandas as pd
+from decouple import config
+from openai import AsyncOpenAI, RateLimitError
+from openai.lib._parsing._completions import type_to_response_format_param
+
+from cache_llm import CacheLLM, get_chave
+from cliente_batch import ERROS_TRANSITORIOS, ESPERA_BASE, ESPERA_MAXIMA, TENTATIVAS
+from config import MODELO, SYSTEM_PROMPT, USER_PROMPT
+from dto import RespostaLLM
+from logs import get_logger
+from tokens import tokens_requisicoes
+
+logger = get_logger()
+
+response_format = type_to_response_format_param(RespostaLLM)
+
+# Limites iniciais da conta, corrigidos pelos headers x-ratelimit-* das respostas.
+REQUISICOES_POR_MINUTO: int = config("REALTIME_RPM", default=500, cast=int)
+TOKENS_POR_MINUTO: int = config("REALTIME_TPM", default=200_000, cast=int)
+CONCORRENCIA: int = config("REALTIME_CONCORRENCIA", default=32, cast=int)
+
+# Tokens reservados para a resposta de cada requisição (decisão e motivo).
+TOKENS_SAIDA = 128
+
+# Respostas acumuladas antes de cada gravação no cache.
+TAMANHO_CHECKPOINT = 200
+
+DURACAO = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+SEGUNDOS_POR_UNIDADE = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def ler_duracao(valor: str | None) -> float | None:
+    """Durações dos headers da OpenAI (`20ms`, `1.5s`, `6m0s`) em segundos."""
+    if not valor:
+        return None
+    partes = DURACAO.findall(valor)
+    if not partes:
+        try:
+            return float(valor)
+        except ValueError:
+            return None
+    return sum(float(n) * SEGUNDOS_POR_UNIDADE[unidade] for n, unidade in partes)
+
+
+class Balde:
+    """Token bucket que se enche até `capacidade` ao longo de um minuto."""
+
+    def __init__(self, capacidade: int):
+        self.capacidade = capacidade
+        self.nivel = float(capacidade)
+        self.atualizado = time.monotonic()
+
+    def encher(self, agora: float):
+        taxa = self.capacidade / 60
+        self.nivel = min(self.capacidade, self.nivel + (agora - self.atualizado) * taxa)
+        self.atualizado = agora
+
+    def espera(self, quantidade: int) -> float:
+        """Segundos até o balde ter `quantidade`. Pedidos maiores que a
+        capacidade esperam o balde cheio."""
+        falta = min(quantidade, self.capacidade) - self.nivel
+        return max(0.0, falta / (self.capacidade / 60))
+
+
+class LimitadorTaxa:
+    """Limita requisições e tokens por minuto com dois token buckets. Os
+    limites e o que resta em cada janela são ajustados pelos headers
+    `x-ratelimit-*` de cada resposta, e um 429 pausa todos até o reset."""
+
+    def __init__(
+        self,
+        requisicoes_por_minuto: int = REQUISICOES_POR_MINUTO,
+        tokens_por_minuto: int = TOKENS_POR_MINUTO,
+    ):
+        self.requisicoes = Balde(requisicoes_por_minuto)
+        self.tokens = Balde(tokens_por_minuto)
+        self.retomar_em = 0.0
+        self.trava = asyncio.Lock()
+
+    async def adquirir(self, tokens: int):
+        # A trava mantém a ordem de chegada: só o primeiro da fila espera o balde.
+        async with self.trava:
+            while True:
+                agora = time.monotonic()
+                self.requisicoes.encher(agora)
+                self.tokens.encher(agora)
+                espera = max(
+                    self.retomar_em - agora,
+                    self.requisicoes.espera(1),
+                    self.tokens.espera(tokens),
+                )
+                if espera <= 0:
+                    break
+                await asyncio.sleep(espera)
+
+            self.requisicoes.nivel -= 1
+            self.tokens.nivel -= tokens
+
+    def pausar(self, segundos: float):
+        self.retomar_em = max(self.retomar_em, time.monotonic() + segundos)
+
+    def atualizar(self, headers):
+        if headers is None:
+            return
+
+        baldes = ((self.requisicoes, "requests"), (self.tokens, "tokens"))
+        for balde, sufixo in baldes:
+            limite = headers.get(f"x-ratelimit-limit-{sufixo}")
+            restante = headers.get(f"x-ratelimit-remaining-{sufixo}")
+            if limite and limite.isdigit():
+                balde.capacidade = int(limite)
+            if restante and restante.isdigit():
+                balde.nivel = min(balde.nivel, int(restante))
+                if int(restante) == 0:
+                    reset = ler_duracao(headers.get(f"x-ratelimit-reset-{sufixo}"))
+                    self.pausar(reset or 1.0)
+
+
+class ClassificadorRealtime:
+    """Classifica notícias para um ticker pela API de chat, em tempo real.
+
+    As requisições passam pelo LimitadorTaxa, com no máximo `concorrencia`
+    em andamento, e cada uma faz novas tentativas com backoff exponencial em
+    erros transitórios. As respostas são gravadas no CacheLLM em lotes, que
+    serve de checkpoint: uma execução interrompida retoma só o que falta.
+
+    O cliente, o semáforo e o limitador pertencem ao event loop em que foram
+    usados, então são criados a cada `classificar`: a mesma instância pode ser
+    usada em várias chamadas de `asyncio.run`."""
+
+    def __init__(
+        self,
+        ticker: str,
+        concorrencia: int = CONCORRENCIA,
+        tentativas: int = TENTATIVAS,
+        requisicoes_por_minuto: int = REQUISICOES_POR_MINUTO,
+        tokens_por_minuto: int = TOKENS_POR_MINUTO,
+    ):
+        self.system_prompt = SYSTEM_PROMPT.format(ticker=ticker)
+        self.concorrencia = concorrencia
+        self.tentativas = tentativas
+        self.requisicoes_por_minuto = requisicoes_por_minuto
+        self.tokens_por_minuto = tokens_por_minuto
+        self.cache = CacheLLM()
+        self.respostas: list[dict] = []
+
+    def checkpoint(self):
+        if self.respostas:
+            self.cache.salvar(pd.DataFrame(self.respostas))
+            self.respostas = []
+
+    async def _requisitar(self, user_prompt: str, tokens: int) -> dict:
+        criar = self.client.chat.completions.with_raw_response.create
+        for tentativa in range(self.tentativas):
+            await self.limitador.adquirir(tokens)
+            async with self.semaforo:
+                try:
+                    resposta = await criar(
+                        model=MODELO,
+                        messages=[
+                            {"role": "system", "content": self.system_prompt},
+                            {"role": "user", "content": user_prompt},
+                        ],
+                        response_format=response_format,
+                    )
+                    self.limitador.atualizar(resposta.headers)
+                    completion = resposta.parse()
+                    return json.loads(completion.choices[0].message.content)
+                except ERROS_TRANSITORIOS as err:
+                    if tentativa == self.tentativas - 1:
+                        raise
+                    erro = err
+
+            if isinstance(erro, RateLimitError):
+                headers = erro.response.headers
+                self.limitador.atualizar(headers)
+                self.limitador.pausar(ler_duracao(headers.get("retry-after")) or 1.0)
+
+            espera = random.uniform(0, min(ESPERA_MAXIMA, ESPERA_BASE * 2**tentativa))
+            logger.info(
+                f"status=nova_tentativa tentativa={tentativa + 1} espera={espera:.1f}s erro={erro}"
+            )
+            await asyncio.sleep(espera)
+
+    async def _classificar(self, chave: str, user_prompt: str, tokens: int):
+        try:
+            resposta = await self._requisitar(user_prompt, tokens)
+        except Exception as err:
+            logger.error(f"status=erro_ao_classificar chave={chave} erro={err}")
+            return
+
+        self.respostas.append(
+            {
+                "chave": chave,
+                "decisao": resposta["decisao"],
+                "motivo": resposta["motivo"],
+            }
+        )
+        if len(self.respostas) >= TAMANHO_CHECKPOINT:
+            self.checkpoint()
+
+    async def classificar(self, df: pd.DataFrame) -> pd.Series:
+        """Resposta ({decisao, motivo}) de cada notícia (colunas date e
+        content), ou None nas que falharam em todas as tentativas."""
+        user_prompts = [
+            USER_PROMPT.format(data=data, noticia=noticia)
+            for data, noticia in zip(df["date"], df["content"])
+        ]
+        chaves = [get_chave(MODELO, self.system_prompt, p) for p in user_prompts]
+
+        em_cache = set(self.cache.obter(chaves)["chave"])
+        pendentes = {
+            chave: user_prompt
+            for chave, user_prompt in zip(chaves, user_prompts)
+            if chave not in em_cache
+        }
+        logger.info(
+            f"noticias={len(chaves)} em_cache={len(em_cache)} pendentes={len(pendentes)}"
+        )
+
+        # Os tokens só alimentam o limitador de taxa: uma estimativa basta.
+        tokens = tokens_requisicoes(
+            self.system_prompt, response_format, list(pendentes.values()), estimar=True
+        )
+        self.client = AsyncOpenAI(api_key=config("OPENAI_API_KEY"), max_retries=0)
+        self.semaforo = asyncio.Semaphore(self.concorrencia)
+        self.limitador = LimitadorTaxa(
+            self.requisicoes_por_minuto, self.tokens_por_minuto
+        )
+        try:
+            await asyncio.gather(
+                *(
+                    self._classificar(chave, user_prompt, int(n) + TOKENS_SAIDA)
+                    for (chave, user_prompt), n in zip(pendentes.items(), tokens)
+                )
+            )
+        finally:
+            self.checkpoint()
+            await self.client.close()
+
+        respostas = self.cache.obter(chaves).set_index("chave")
+        respostas = respostas[["decisao", "motivo"]].to_dict("index")
+        return pd.Series([respostas.get(chave) for chave in chaves], index=df.index)
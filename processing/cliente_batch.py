@@ -0,0 +1,96 @@
+import asyncio
+import random
+
+from decouple import config
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncOpenAI,
+    InternalServerError,
+    RateLimitError,
+)
+from sqlalchemy.orm import Session
+
+from logs import get_logger
+
+logger = get_logger()
+
+CONCORRENCIA: int = config("BATCH_CONCORRENCIA", default=16, cast=int)
+TENTATIVAS: int = config("BATCH_TENTATIVAS", default=5, cast=int)
+ESPERA_BASE = 1.0
+ESPERA_MAXIMA = 60.0
+
+ERROS_TRANSITORIOS = (
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
+
+
+class ClienteBatch:
+    """Cliente assíncrono da OpenAI com limite de chamadas simultâneas e
+    novas tentativas, com backoff exponencial e jitter, em erros transitórios."""
+
+    def __init__(self, concorrencia: int = CONCORRENCIA, tentativas: int = TENTATIVAS):
+        self.client = AsyncOpenAI(api_key=config("OPENAI_API_KEY"), max_retries=0)
+        self.semaforo = asyncio.Semaphore(concorrencia)
+        self.tentativas = tentativas
+
+    async def chamar(self, metodo, *args, **kwargs):
+        for tentativa in range(self.tentativas):
+            async with self.semaforo:
+                try:
+                    return await metodo(*args, **kwargs)
+                except ERROS_TRANSITORIOS as err:
+                    if tentativa == self.tentativas - 1:
+                        raise
+                    erro = err
+
+            espera = random.uniform(0, min(ESPERA_MAXIMA, ESPERA_BASE * 2**tentativa))
+            logger.info(
+                f"status=nova_tentativa tentativa={tentativa + 1} espera={espera:.1f}s erro={erro}"
+            )
+            await asyncio.sleep(espera)
+
+
+class EscritorBanco:
+    """Serializa as escritas no banco: as alterações são enfileiradas e
+    aplicadas por uma única task, com um commit para todas as que estavam na
+    fila."""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.fila: asyncio.Queue = asyncio.Queue()
+        self.task: asyncio.Task | None = None
+
+    def atualizar(self, registro, **valores):
+        self.fila.put_nowait((registro, valores))
+
+    async def _executar(self):
+        terminou = False
+        while not terminou:
+            itens = [await self.fila.get()]
+            while not self.fila.empty():
+                itens.append(self.fila.get_nowait())
+
+            terminou = None in itens
+            itens = [item for item in itens if item is not None]
+            try:
+                for registro, valores in itens:
+                    for campo, valor in valores.items():
+                        setattr(registro, campo, valor)
+                self.session.commit()
+            except Exception as err:
+                self.session.rollback()
+                logger.error(
+                    f"status=erro_ao_salvar alteracoes={len(itens)} erro={err}"
+                )
+
+    async def __aenter__(self):
+        self.task = asyncio.create_task(self._executar())
+        return self
+
+    async def __aexit__(self, *_):
+        self.fila.put_nowait(None)
+        await self.task
@@ -4,6 +4,11 @@ OUTPUT_PATH = "data/output3"
 STRATEGY_PATH = "data/strategies4"
 GRAPH_PATH = "graficos3"
 
+MODELO = "gpt-5-nano"
+
+# Rótulo dos arquivos e BatchLogs com requisições de vários tickers por notícia.
+TICKER_MULTI = "multi"
+
 SYSTEM_PROMPT = """
 Considere que hoje é a data informada pelo cliente, não leve em consideração dados publicados depois deste dia. 
 Você é um analista financeiro especialista em mercado de capitais, com experiência em avaliação de notícias e 
@@ -56,6 +61,34 @@ Instruções:
 # 4. Após a recomendação, escreva uma justificativa objetiva, com no máximo 64 tokens.
 # """
 
+SYSTEM_PROMPT_MULTI = """
+Considere que hoje é a data informada pelo cliente, não leve em consideração dados publicados depois deste dia. 
+Você é um analista financeiro especialista em mercado de capitais, com experiência em avaliação de notícias e 
+recomendação de investimentos em ações. Sua tarefa é analisar a notícia fornecida e emitir uma recomendação 
+para cada uma das ações a seguir: {tickers}. Considere o contexto macroeconômico e os fundamentos de cada empresa.
+
+
+Instruções:
+
+1. Leia atentamente o texto da notícia.
+
+2. Para cada ação, avalie se a informação tem impacto positivo, negativo ou neutro sobre ela.
+
+- Impacto positivo: favorece a valorização da ação.
+- Impacto negativo: desfavorece ou aumenta riscos para a ação.
+- Impacto neutro: não impacta a ação, nem possui nenhuma relação com a empresa.
+
+3. Emita, para cada ação, uma recomendação clara, escolhendo apenas uma das opções abaixo:
+
+- LONG → entrar em posição Long, quando a notícia aponta para um cenário favorável à ação.
+- SHORT → entrar em posição Short, quando a notícia aponta para um cenário desfavorável à ação.
+- UNKNOWN → não mudar de posição, quando o conteúdo da notícia não se relaciona com a ação.
+
+4. Após cada recomendação, escreva uma justificativa objetiva, com no máximo 64 tokens.
+
+5. Responda com exatamente uma decisão por ação, usando no campo ticker o código exatamente como informado acima.
+"""
+
 USER_PROMPT = """Hoje é dia {data}. Analise o seguinte texto: 
 
 "{noticia}"
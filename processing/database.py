@@ -1,4 +1,18 @@
-from sqlalchemy import Boolean, Integer, String, create_engine
+from datetime import datetime
+from functools import cache
+
+from sqlalchemy import (
+    Boolean,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    Text,
+    create_engine,
+    event,
+    inspect,
+    text,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from decouple import config
 
@@ -6,19 +20,47 @@ from decouple import config
 url = ""
 sqlite_url = config("SQLITE_URL")
 
+# Espera, em segundos, por uma trava de escrita antes de falhar com
+# "database is locked".
+SQLITE_TIMEOUT: int = config("SQLITE_TIMEOUT", default=30, cast=int)
+
 if url:
     engine = create_engine(url)
 
 if sqlite_url:
-    sqlite_engine = create_engine(sqlite_url)
+    sqlite_engine = create_engine(sqlite_url, connect_args={"timeout": SQLITE_TIMEOUT})
+
+    @event.listens_for(sqlite_engine, "connect")
+    def _configurar_sqlite(conexao, _):
+        """WAL deixa as leituras seguirem durante uma escrita, e o busy_timeout
+        faz os processos esperarem a trava em vez de falharem."""
+        cursor = conexao.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_TIMEOUT * 1000}")
+        cursor.close()
+
+
+def reiniciar_conexoes():
+    """Descarta, sem fechar, as conexões herdadas do processo pai. Deve ser
+    chamada no início de cada processo filho, antes de abrir uma sessão."""
+    sqlite_engine.dispose(close=False)
 
 
 class Base(DeclarativeBase):
     pass
 
 
+# Status dos batches na OpenAI: os em andamento ainda precisam ser consultados.
+STATUS_EM_ANDAMENTO = ("validating", "in_progress", "finalizing", "cancelling")
+STATUS_TERMINAIS = ("completed", "failed", "expired", "cancelled")
+
+
 class BatchLog(Base):
     __tablename__ = "batch_log"
+    __table_args__ = (
+        Index("ix_batch_log_ticker_sub_id", "ticker", "sub_id", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     ticker: Mapped[str] = mapped_column(String(10))
@@ -27,3 +69,88 @@ class BatchLog(Base):
     file_name: Mapped[str | None] = mapped_column(String(256), nullable=True)
     file_id: Mapped[str | None] = mapped_column(String(256), nullable=True)
     should_retry: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
+    status: Mapped[str | None] = mapped_column(String(32), nullable=True, index=True)
+    updated_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    requisicoes: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # sha256 do JSONL local no momento em que foi enviado.
+    file_sha256: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # Saída já baixada para OUTPUT_PATH e o sha256 do arquivo salvo.
+    output_file_id: Mapped[str | None] = mapped_column(String(256), nullable=True)
+    output_sha256: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # Arquivo com as requisições que falharam em um batch completo e, nos
+    # batches de nova tentativa, o BatchLog de onde elas vieram.
+    error_file_id: Mapped[str | None] = mapped_column(String(256), nullable=True)
+    origem_id: Mapped[int | None] = mapped_column(Integer, nullable=True, index=True)
+    # Se a saída baixada já foi carregada na tabela resultado_batch.
+    output_ingerido: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
+
+
+class RespostaCache(Base):
+    """Respostas do LLM indexadas pelo hash da requisição (modelo e prompts)."""
+
+    __tablename__ = "resposta_cache"
+
+    chave: Mapped[str] = mapped_column(String(64), primary_key=True)
+    modelo: Mapped[str] = mapped_column(String(64))
+    decisao: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    motivo: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+
+class ResultadoBatch(Base):
+    """Decisão de cada notícia por ticker, carregada das saídas dos batches."""
+
+    __tablename__ = "resultado_batch"
+
+    ticker: Mapped[str] = mapped_column(String(10), primary_key=True)
+    hash_id: Mapped[str] = mapped_column(String(256), primary_key=True, index=True)
+    decisao: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    motivo: Mapped[str | None] = mapped_column(Text, nullable=True)
+    modelo: Mapped[str] = mapped_column(String(64))
+    batch_id: Mapped[str | None] = mapped_column(String(256), nullable=True)
+    custom_id: Mapped[str | None] = mapped_column(String(256), nullable=True)
+    # Chave do CacheLLM da requisição que foi de fato enviada, calculada a
+    # partir do JSONL de entrada. Vazia nas requisições multi-ticker.
+    chave: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+
+def _adicionar_colunas(conexao, tabela):
+    """Adiciona à tabela já existente as colunas que o modelo ganhou depois."""
+    colunas = {c["name"] for c in inspect(conexao).get_columns(tabela.name)}
+    for coluna in tabela.columns:
+        if coluna.name not in colunas:
+            tipo = coluna.type.compile(conexao.dialect)
+            conexao.execute(
+                text(f"ALTER TABLE {tabela.name} ADD COLUMN {coluna.name} {tipo}")
+            )
+
+
+def _migrar_batch_log(conexao):
+    """Adiciona ao `batch_log` já existente as colunas e índices novos. Antes do
+    índice único, mantém um registro por (ticker, sub_id), preferindo os que
+    não precisam ser reenviados."""
+
+    _adicionar_colunas(conexao, BatchLog.__table__)
+
+    conexao.execute(text("""
+            DELETE FROM batch_log WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY ticker, sub_id ORDER BY should_retry, id
+                    ) AS ordem
+                    FROM batch_log
+                ) WHERE ordem > 1
+            )
+            """))
+    for indice in BatchLog.__table__.indexes:
+        indice.create(conexao, checkfirst=True)
+
+
+@cache
+def criar_tabelas():
+    """Cria as tabelas que ainda não existem no banco e migra as existentes.
+    Roda uma única vez por processo; as chamadas seguintes não acessam o banco."""
+    with sqlite_engine.begin() as conexao:
+        Base.metadata.create_all(conexao)
+        _migrar_batch_log(conexao)
+        _adicionar_colunas(conexao, ResultadoBatch.__table__)
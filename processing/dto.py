@@ -4,3 +4,13 @@ from pydantic import BaseModel, Field
 class RespostaLLM(BaseModel):
     decisao: str = Field(description="A decisão sugerida")
     motivo: str = Field(description="A justificativa para a decisão, em até 64 tokens")
+
+
+class DecisaoTicker(RespostaLLM):
+    ticker: str = Field(description="O código do ticker avaliado")
+
+
+class RespostaMultiTicker(BaseModel):
+    decisoes: list[DecisaoTicker] = Field(
+        description="Uma decisão para cada ticker informado"
+    )
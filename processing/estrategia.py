@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from config import STRATEGY_PATH
+from precos import get_armazem
+
+
+def ler_precos(ticker: str) -> pd.DataFrame:
+    """Histórico de preços do ticker com os nomes de coluna normalizados."""
+    return get_armazem().ler(ticker)
+
+
+FUSO_HORARIO = "America/Sao_Paulo"
+
+
+def normalizar_datas(datas) -> pd.DatetimeIndex:
+    """Dia de cada data, à meia-noite em São Paulo. Datas com fuso são levadas
+    ao dia no próprio fuso antes de serem localizadas."""
+    datas = pd.DatetimeIndex(pd.to_datetime(datas))
+    if datas.tz is not None:
+        datas = datas.tz_localize(None)
+    return datas.normalize().tz_localize(FUSO_HORARIO)
+
+
+def agregar_decisoes(
+    datas: pd.Series,
+    decisoes: pd.Series,
+    pesos: pd.Series | None = None,
+    normalizar: bool = False,
+) -> pd.DataFrame:
+    """Decisão de maior peso em cada data (colunas date e posicao); sem
+    `pesos`, cada notícia vale 1 e vence a moda. Notícias sem data ou sem
+    decisão são ignoradas, e pesos nulos contam como zero. Com `normalizar`,
+    as datas são agrupadas por dia (ver `normalizar_datas`).
+
+    Em caso de empate, vence a decisão que vem primeiro em ordem alfabética
+    (LONG, SHORT, UNKNOWN), a mesma ordem do groupby usado antes.
+
+    Datas e decisões viram códigos inteiros, a normalização é feita só nas
+    datas distintas, e os pesos de cada par (data, decisão) são somados com
+    um único bincount."""
+    codigos_decisao, categorias = pd.factorize(decisoes, sort=True)
+    codigos_data, datas_unicas = pd.factorize(datas)
+    validas = (codigos_decisao >= 0) & (codigos_data >= 0)
+
+    if normalizar:
+        datas_unicas = normalizar_datas(datas_unicas)
+    codigos_dia, dias = pd.factorize(datas_unicas, sort=True)
+
+    quantidade = len(categorias)
+    pares = codigos_dia[codigos_data[validas]] * quantidade + codigos_decisao[validas]
+    tamanho = len(dias) * quantidade
+    presentes = np.bincount(pares, minlength=tamanho)
+    if pesos is None:
+        soma = presentes.astype(float)
+    else:
+        valores = np.nan_to_num(np.asarray(pesos, dtype=float)[validas])
+        soma = np.bincount(pares, weights=valores, minlength=tamanho)
+
+    # Pares que não aparecem no dia nunca vencem, mesmo com as somas zeradas.
+    soma = np.where(presentes > 0, soma, -np.inf).reshape(len(dias), quantidade)
+    usados = soma.max(axis=1, initial=-np.inf) > -np.inf
+    posicao = categorias.to_numpy()[soma[usados].argmax(axis=1)] if quantidade else []
+
+    return pd.DataFrame({"date": dias[usados], "posicao": posicao})
+
+
+def get_df_decisao_moda(df: pd.DataFrame):
+    """Decisão mais frequente de cada dia."""
+    return agregar_decisoes(df["date"], df["decisao"], normalizar=True)
+
+
+def agregar_decisao_por_dia(df: pd.DataFrame):
+    """Decisão com a maior soma de bm25 em cada data, sem normalizar as datas."""
+    return agregar_decisoes(df["date"], df["decisao"], df["bm25"])
+
+
+def get_df_decisao_bm25(df: pd.DataFrame):
+    """Agrega as decisões do dia pela soma do bm25, com as datas normalizadas
+    para o dia como em `get_df_decisao_moda`."""
+    return agregar_decisoes(df["date"], df["decisao"], df["bm25"], normalizar=True)
+
+
+METODOS_AGREGACAO = {
+    "moda": get_df_decisao_moda,
+    "bm25": get_df_decisao_bm25,
+}
+
+
+def get_df_final(ticker: str, df: pd.DataFrame):
+    df_ticker = ler_precos(ticker)
+
+    final = pd.merge(df_ticker, df, on="date", how="left")
+    # final = final[final.date > "2017-09-12"]
+    return final
+
+
+def resultados_salvos() -> list[str]:
+    """Nomes com resultado de backtest salvo (`{nome}-resultado.parquet`)."""
+    sufixo = "-resultado.parquet"
+    return sorted(
+        f.removesuffix(sufixo) for f in os.listdir(STRATEGY_PATH) if f.endswith(sufixo)
+    )
@@ -0,0 +1,88 @@
+import argparse
+from multiprocessing import Pool
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from matplotlib.gridspec import GridSpec
+
+from config import GRAPH_PATH, STRATEGY_PATH
+from estrategia import resultados_salvos
+from logs import get_logger
+
+logger = get_logger()
+
+NUM_WORKERS = 8
+
+VERDE = "#4DAF4A"
+VERMELHO = "#E74C3C"
+
+
+def plotar_retornos(nome: str, df: pd.DataFrame):
+    df = df.set_index(["date"])
+
+    mask_long = df["mudanca"] == "LONG"
+    mask_short = df["mudanca"] == "SHORT"
+
+    df_long = df[mask_long]
+    df_short = df[mask_short]
+
+    fig = plt.figure(figsize=(18, 10), dpi=140)
+    gs = GridSpec(2, 1, height_ratios=[1.5, 0.5])
+    ax1 = fig.add_subplot(gs[0, 0])
+    ax2 = fig.add_subplot(gs[1, 0])
+
+    ax1.plot(df.index, df["dinheiro"], color="#377EB8", lw=2)
+    ax1.plot(df.index, df["bnh"], color="#2C3E50", ls="--", lw=2)
+    ax1.scatter(df_long.index, df_long["dinheiro"], s=50, zorder=5, color=VERDE)
+    ax1.scatter(df_short.index, df_short["dinheiro"], s=50, zorder=5, color=VERMELHO)
+
+    cores = np.where(df["retornos"].to_numpy() >= 0, VERDE, VERMELHO)
+    ax2.bar(df.index, df["retornos"], color=cores)
+
+    ax1.spines["right"].set_visible(False)
+    ax1.spines["top"].set_visible(False)
+    ax1.set_ylabel("Retorno (R$)")
+    ax1.set_xlabel("Data")
+
+    ax2.spines["right"].set_visible(False)
+    ax2.spines["top"].set_visible(False)
+    ax2.set_ylabel("Retorno (%)")
+    ax2.set_xlabel("Data")
+
+    plt.tight_layout()
+    fig.savefig(f"{GRAPH_PATH}/{nome}.png")
+    plt.close(fig)
+
+
+def renderizar(nome: str):
+    """Desenha o gráfico a partir de `{nome}-resultado.parquet`."""
+    df = pd.read_parquet(
+        f"{STRATEGY_PATH}/{nome}-resultado.parquet",
+        columns=["date", "dinheiro", "bnh", "mudanca", "retornos"],
+    )
+    plotar_retornos(nome, df)
+    logger.info(f"grafico={nome} path={GRAPH_PATH}/{nome}.png")
+
+
+def renderizar_graficos(nomes: list[str], num_workers: int = NUM_WORKERS):
+    """Renderiza os gráficos dos resultados já salvos em um pool de processos."""
+    if not nomes:
+        return
+
+    with Pool(min(num_workers, len(nomes))) as pool:
+        pool.map(renderizar, nomes)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--ticker", dest="ticker", type=str)
+parser.add_argument("--workers", dest="workers", type=int, default=NUM_WORKERS)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    nomes = [args.ticker] if args.ticker else resultados_salvos()
+    renderizar_graficos(nomes, args.workers)
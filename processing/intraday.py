@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+from precos import get_armazem
+from utils import is_weekend
+
+FUSO = "America/Sao_Paulo"
+
+# Barras (pelo horário de início) consideradas dentro do pregão regular da B3.
+HORA_ABERTURA = 10
+HORA_FECHAMENTO = 18
+
+
+def no_fuso(datas: pd.Series) -> pd.Series:
+    """Converte as datas para o fuso da B3; datas sem fuso são tratadas como locais."""
+    datas = pd.to_datetime(datas)
+    if datas.dt.tz is None:
+        datas = datas.dt.tz_localize(FUSO)
+    return datas.dt.tz_convert(FUSO).dt.as_unit("ns")
+
+
+def em_pregao(datas: pd.Series) -> np.ndarray:
+    """Marca as barras que começam dentro do horário do pregão, em dias úteis.
+
+    Fins de semana e feriados (`utils.br_holidays`) são avaliados uma única vez
+    por dia distinto e propagados para as barras, sem iterar linha a linha."""
+
+    hora = datas.dt.hour.to_numpy()
+    no_horario = (hora >= HORA_ABERTURA) & (hora < HORA_FECHAMENTO)
+
+    dias = datas.dt.tz_localize(None).dt.normalize().to_numpy()
+    unicos, posicoes = np.unique(dias, return_inverse=True)
+    uteis = np.array(
+        [not is_weekend(dia) for dia in pd.DatetimeIndex(unicos).date], dtype=bool
+    )
+    return no_horario & uteis[posicoes]
+
+
+def ler_barras(ticker: str) -> pd.DataFrame:
+    """Lê as barras de 1h de `{ticker}-hora.parquet`, mantendo apenas as
+    negociáveis, ordenadas pelo horário de início."""
+
+    barras = get_armazem().ler(f"{ticker}-hora")
+    barras["date"] = no_fuso(barras["date"])
+
+    barras = barras[em_pregao(barras["date"])]
+    return barras.sort_values("date").reset_index(drop=True)
+
+
+def alinhar_noticias(noticias: pd.DataFrame, barras: pd.DataFrame) -> pd.DataFrame:
+    """Associa cada notícia à primeira barra negociável que começa no mesmo
+    horário ou depois dela (as-of join para frente). Notícias posteriores à
+    última barra ficam de fora."""
+
+    noticias = noticias[noticias["decisao"].notna()].copy()
+    noticias["date"] = no_fuso(noticias["date"])
+    noticias = noticias.sort_values("date")
+
+    inicio_barras = barras[["date"]].rename(columns={"date": "barra"})
+    alinhadas = pd.merge_asof(
+        noticias,
+        inicio_barras,
+        left_on="date",
+        right_on="barra",
+        direction="forward",
+    )
+    return alinhadas[alinhadas["barra"].notna()]
+
+
+def get_df_decisao_por_barra(alinhadas: pd.DataFrame) -> pd.DataFrame:
+    """Decisão mais frequente entre as notícias de cada barra. Em caso de
+    empate vence a decisão em ordem alfabética, como no `idxmax` da agregação
+    diária."""
+
+    contagem = alinhadas.groupby(["barra", "decisao"]).size().reset_index(name="count")
+    contagem = contagem.sort_values(
+        ["barra", "count", "decisao"], ascending=[True, False, True]
+    )
+    moda = contagem.drop_duplicates("barra")
+    return moda.rename(columns={"barra": "date", "decisao": "posicao"})[
+        ["date", "posicao"]
+    ]
+
+
+def get_df_final_intraday(ticker: str, noticias: pd.DataFrame) -> pd.DataFrame:
+    barras = ler_barras(ticker)
+    decisoes = get_df_decisao_por_barra(alinhar_noticias(noticias, barras))
+    return pd.merge(barras, decisoes, on="date", how="left")
@@ -1,121 +1,35 @@
+import asyncio
 import os
 import pandas as pd
 import argparse
-from agno.agent import Agent
-from agno.models.openai import OpenAIChat
-from decouple import config
-from pydantic import BaseModel
 
-from pandarallel import pandarallel
-from agno.exceptions import ModelProviderError
 from logs import get_logger
-from config import SYSTEM_PROMPT, USER_PROMPT
-from dto import RespostaLLM
+from classificador import ClassificadorRealtime
+from estrategia import get_df_decisao_moda, get_df_final
 
 logger = get_logger()
 
-API_KEY: str = config("OPENAI_API_KEY")
-
 
 class ModelWrapper:
     def __init__(self, ticker: str) -> None:
-        self.agent = Agent(
-            model=OpenAIChat("gpt-5-nano", api_key=API_KEY),
-            markdown=True,
-            response_model=RespostaLLM,
-            instructions=[SYSTEM_PROMPT.format(ticker=ticker)],
-        )
-
-    def coletar(self, x):
-        gerado = USER_PROMPT.format(data=x["date"], noticia=x["content"])
-        try:
-            message = self.agent.run(gerado).content
-        except ModelProviderError:
-            return 429
-
-        if isinstance(message, BaseModel):
-            return message.model_dump()
-
-        return message
+        self.classificador = ClassificadorRealtime(ticker)
 
-    def tentar_novamente(self, x):
-        if x["resposta"] == 429:
-            return self.coletar(x)
-        return x["resposta"]
-
-
-pandarallel.initialize(nb_workers=16)
+    def coletar(self, df: pd.DataFrame) -> pd.Series:
+        """Resposta de cada notícia em uma única passada, no limite de taxa da
+        API. As notícias que falharam em todas as tentativas ficam com None e
+        são retomadas na próxima execução; as demais vêm do cache."""
+        return asyncio.run(self.classificador.classificar(df))
 
 
 def extract_model_response(df: pd.DataFrame):
     df["date"] = pd.to_datetime(df["date"]).dt.tz_localize("America/Sao_Paulo")
-
-    def extrair_resposta(x):
-        aux = x["resposta"]
-        return aux["decisao"]
-
-    df["decisao"] = df.apply(extrair_resposta, axis=1)
-
-    def extrair_resposta(x):
-        aux = x["resposta"]
-        return aux["motivo"]
-
-    df["motivo"] = df.apply(extrair_resposta, axis=1)
+    df["decisao"] = df["resposta"].str.get("decisao")
+    df["motivo"] = df["resposta"].str.get("motivo")
     return df
 
 
-def get_df_decisao_moda(df: pd.DataFrame):
-    df["date"] = df["date"].apply(lambda x: x.date())
-    df["date"] = pd.to_datetime(df["date"])
-    df["date"] = df["date"].dt.tz_localize("America/Sao_Paulo")
-    com_decisao = (
-        df.groupby(by=["date", "decisao"])["decisao"]
-        .value_counts()
-        .groupby(level=0)
-        .idxmax()
-        .reset_index()
-    )
-
-    com_decisao["posicao"] = com_decisao["count"].apply(lambda x: x[1])
-    return com_decisao.drop(columns=["count"])
-
-
-def agregar_decisao_por_dia(df: pd.DataFrame):
-    df = df[df.decisao.isnull() == False]
-    com_decisao = (
-        df.groupby(by=["date", "decisao"])["bm25"]
-        .sum()
-        .groupby(level=0)
-        .idxmax()
-        .reset_index()
-    )
-
-    com_decisao["posicao"] = com_decisao["bm25"].apply(lambda x: x[1])
-    return com_decisao.drop(columns=["bm25"])
-
-
-def get_df_final(ticker: str, df: pd.DataFrame):
-    ticker_data = pd.read_parquet(f"data/tickers2/{ticker}.parquet").reset_index()
-    df_ticker = ticker_data.rename(
-        columns={
-            "Date": "date",
-            "Open": "open",
-            "Close": "close",
-            "High": "high",
-            "Low": "low",
-            "Volume": "volume",
-            "Dividends": "dividends",
-            "Stock Splits": "stock_splits",
-        }
-    )
-
-    final = pd.merge(df_ticker, df, on="date", how="left")
-    # final = final[final.date > "2017-09-12"]
-    return final
-
-
 def sucesso(df: pd.DataFrame) -> bool:
-    return len(df[df.resposta == 429]) == 0
+    return df.resposta.notna().all()
 
 
 def analyze_news(ticker: str):
@@ -123,17 +37,13 @@ def analyze_news(ticker: str):
     # logger.info(f" == Analisando ticker {ticker}")
     # data = pd.read_parquet(f"data/filtragem-llm/{ticker}.parquet").reset_index()
     # logger.info("Iniciando a consulta ao LLM")
-    # data["resposta"] = data.parallel_apply(model.coletar, axis=1)
-    #
-    # if not sucesso(data):
-    #     logger.info("Erros identificados. Tentando novamente")
-    #     data["resposta"] = data.parallel_apply(model.tentar_novamente, axis=1)
+    # data["resposta"] = model.coletar(data)
     #
     # if not sucesso(data):
     #     caminho = f"data/strategies/{ticker}-erro.parquet"
     #
     #     total = len(data)
-    #     registros_com_erro = len(data[data.resposta == 429])
+    #     registros_com_erro = data.resposta.isna().sum()
     #     registros_com_sucesso = total - registros_com_erro
     #
     #     logger.info(
@@ -1,16 +1,32 @@
 import math
 import argparse
+import glob
+import hashlib
+import inspect
+import json
 import os
 import datetime
+import shutil
 from time import sleep
 import warnings
 import pandas as pd
 from multiprocessing import Process
+import nltk
+import numpy as np
 from numpy import ndarray
+import scipy.sparse
+import sklearn
 from sklearn.feature_extraction.text import TfidfVectorizer
 from pandarallel import pandarallel
 from logs import get_logger
-from utils import is_weekend, pre_processing
+from utils import (
+    CONTRACOES,
+    PONTUACAO,
+    STOPWORDS,
+    is_weekend,
+    pre_processing,
+    pre_processing_lote,
+)
 from sklearn.feature_selection import SelectKBest, f_classif
 from database import engine
 from scipy.stats import zscore
@@ -37,10 +53,57 @@ ORDER BY date
 """
 
 
+# Hash de cada notícia do período, calculado no banco: só os hashes são
+# trazidos para saber se o conteúdo mudou. A ordem não depende do plano.
+QUERY_HASHES = f"""
+SELECT md5(
+    date::text || chr(31) || coalesce(source, '') || chr(31) || coalesce(content, '')
+) AS hash
+FROM juvenal_news
+WHERE date BETWEEN '{BEGIN_DATE}' AND '{END_DATE}'
+ORDER BY date, hash
+"""
+
+CAMINHO_CORPUS = "data/2-filtrado.parquet"
+CAMINHO_ARTEFATOS = "data/cache-juvenal"
+
+
 logger = get_logger()
 
 
+def get_chave_artefato(*partes) -> str:
+    """Hash das entradas e parâmetros de um artefato."""
+    conteudo = json.dumps(partes, default=str, sort_keys=True)
+    return hashlib.sha256(conteudo.encode()).hexdigest()[:16]
+
+
+def get_hash_noticias() -> str:
+    """Hash do conteúdo das notícias do período: sha256 dos hashes de cada
+    linha, em ordem."""
+    sha256 = hashlib.sha256()
+    for hash_linha in pd.read_sql(QUERY_HASHES, con=engine)["hash"]:
+        sha256.update(hash_linha.encode())
+    return sha256.hexdigest()
+
+
+def limpar_artefatos(prefixo: str, chave: str):
+    """Remove as versões antigas do artefato, mantendo a da chave atual."""
+    for caminho in glob.glob(f"{CAMINHO_ARTEFATOS}/{prefixo}-*"):
+        if os.path.basename(caminho).split(".")[0] == f"{prefixo}-{chave}":
+            continue
+        if os.path.isdir(caminho):
+            shutil.rmtree(caminho)
+        else:
+            os.remove(caminho)
+
+
 class ProcessSetup:
+    """Carrega as notícias tratadas e o TF-IDF do corpus do Juvenal. Os dois
+    ficam salvos em `CAMINHO_ARTEFATOS`, identificados por um hash das
+    entradas (conteúdo do banco, arquivo do corpus, código e constantes do
+    tratamento e parâmetros do vetorizador); quando alguma muda, o artefato é
+    refeito."""
+
     def __init__(self):
         self.vectorizer = TfidfVectorizer()
         self.root_folder = "data/treinamento-juvenal/"
@@ -50,6 +113,29 @@ class ProcessSetup:
         """Prepara os dados iniciais para processamento."""
 
         logger.info("Iniciando processo...")
+        os.makedirs(CAMINHO_ARTEFATOS, exist_ok=True)
+
+        self.df = self.get_noticias()
+        self.set_X_total()
+        self.set_subespacos()
+
+    def get_noticias(self) -> pd.DataFrame:
+        """Notícias do período, sem duplicadas nem fins de semana e feriados,
+        com o conteúdo tratado. Usa o artefato salvo quando ele existe."""
+        chave = get_chave_artefato(
+            QUERY,
+            get_hash_noticias(),
+            inspect.getsource(pre_processing),
+            sorted(STOPWORDS),
+            PONTUACAO.pattern,
+            [regex.pattern for regex in CONTRACOES],
+            nltk.__version__,
+            inspect.getsource(is_weekend),
+        )
+        caminho = f"{CAMINHO_ARTEFATOS}/noticias-{chave}.parquet"
+        if os.path.exists(caminho):
+            logger.info(f"Notícias tratadas lidas de {caminho}")
+            return pd.read_parquet(caminho)
 
         df = pd.read_sql(QUERY, con=engine)
         df["duplicado"] = df["content"].duplicated(keep="first")
@@ -59,12 +145,14 @@ class ProcessSetup:
         pandarallel.initialize()
         logger.info("Iniciando tratamento inicial do conteúdo")
 
-        df["content_tratado"] = df["content"].parallel_apply(pre_processing)
+        df["content_tratado"] = pre_processing_lote(df["content"])
         df["weekend"] = df["date"].parallel_apply(is_weekend)
+        df = df[df.weekend == False]
 
-        self.df = df[df.weekend == False]
-        self.set_X_total()
-        self.set_subespacos()
+        df.to_parquet(f"{caminho}.tmp")
+        os.replace(f"{caminho}.tmp", caminho)
+        limpar_artefatos("noticias", chave)
+        return df
 
     def set_subespacos(self):
         """Armazena o subespaço ideal de cada ticker no estado interno da instância"""
@@ -77,9 +165,39 @@ class ProcessSetup:
     def set_X_total(self):
         """Armazena os dados vetorizados do experimento do Juvenal no estado interno da instância"""
 
-        logger.info("Vetorizando os dados originais")
-        df_tokens = pd.read_parquet("data/2-filtrado.parquet")
-        self.X_total = self.vectorizer.fit_transform(df_tokens["content"])
+        corpus = os.stat(CAMINHO_CORPUS)
+        chave = get_chave_artefato(
+            CAMINHO_CORPUS,
+            corpus.st_size,
+            corpus.st_mtime_ns,
+            self.vectorizer.get_params(),
+            sklearn.__version__,
+        )
+        caminho = f"{CAMINHO_ARTEFATOS}/tfidf-{chave}"
+
+        if os.path.isdir(caminho):
+            logger.info(f"TF-IDF lido de {caminho}")
+            self.X_total = scipy.sparse.load_npz(f"{caminho}/X_total.npz")
+            with open(f"{caminho}/vocabulario.json") as arquivo:
+                self.vectorizer.vocabulary_ = json.load(arquivo)
+            self.vectorizer.idf_ = np.load(f"{caminho}/idf.npy")
+        else:
+            logger.info("Vetorizando os dados originais")
+            df_tokens = pd.read_parquet(CAMINHO_CORPUS)
+            self.X_total = self.vectorizer.fit_transform(df_tokens["content"])
+
+            os.makedirs(f"{caminho}.tmp", exist_ok=True)
+            scipy.sparse.save_npz(f"{caminho}.tmp/X_total.npz", self.X_total)
+            with open(f"{caminho}.tmp/vocabulario.json", "w") as arquivo:
+                json.dump(
+                    {p: int(i) for p, i in self.vectorizer.vocabulary_.items()},
+                    arquivo,
+                    ensure_ascii=False,
+                )
+            np.save(f"{caminho}.tmp/idf.npy", self.vectorizer.idf_)
+            os.replace(f"{caminho}.tmp", caminho)
+            limpar_artefatos("tfidf", chave)
+
         self.total_features = self.X_total.shape[1]
 
 
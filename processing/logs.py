@@ -3,6 +3,9 @@ import logging
 
 def get_logger():
     logger = logging.getLogger(__name__)
+    if logger.handlers:
+        return logger
+
     formatter = logging.Formatter(
         "[%(asctime)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
     )
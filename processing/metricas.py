@@ -0,0 +1,120 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import Position
+from config import STRATEGY_PATH
+from estrategia import resultados_salvos
+from logs import get_logger
+
+logger = get_logger()
+
+# Pregões por ano. Nas séries intradiárias, cada pregão tem várias barras.
+DIAS_POR_ANO = 252
+
+COLUNAS_RESULTADO = ["date", "dinheiro", "bnh", "mudanca"]
+
+
+def ler_resultados(nomes: list[str] | None = None) -> pd.DataFrame:
+    """Concatena os `{nome}-resultado.parquet` em um único DataFrame com a
+    coluna `nome` identificando cada backtest."""
+
+    nomes = nomes or resultados_salvos()
+    return pd.concat(
+        [
+            pd.read_parquet(
+                f"{STRATEGY_PATH}/{nome}-resultado.parquet", columns=COLUNAS_RESULTADO
+            ).assign(nome=nome)
+            for nome in nomes
+        ],
+        ignore_index=True,
+    )
+
+
+def calcular_metricas(
+    df: pd.DataFrame,
+    chaves: tuple[str, ...] = ("nome",),
+    periodos_por_ano: int | None = None,
+) -> pd.DataFrame:
+    """Calcula, em uma única passada agrupada, as métricas de cada backtest
+    presente em `df` (linhas de cada backtest contíguas e em ordem de data).
+
+    Sem `periodos_por_ano`, cada backtest é anualizado pelos seus próprios
+    períodos: DIAS_POR_ANO vezes a média de linhas por dia, ou seja, 252 nas
+    séries diárias e 252 vezes as barras por pregão nas de 1h.
+
+    - sharpe: média / desvio dos retornos por período do `dinheiro`, anualizado;
+    - max_drawdown: maior queda (%) do `dinheiro` em relação ao pico anterior;
+    - operacoes e turnover: compras e vendas, no total e anualizadas;
+    - taxa_acerto: fração das operações encerradas (LONG -> SHORT) com lucro;
+    - exposicao: fração dos períodos com capital investido."""
+
+    chaves = list(chaves)
+    grupos = [df[chave] for chave in chaves]
+    grupo = df.groupby(grupos)
+
+    retorno = grupo["dinheiro"].pct_change()
+    drawdown = df["dinheiro"] / grupo["dinheiro"].cummax() - 1
+
+    # A primeira linha de cada backtest guarda a posição inicial: só conta como
+    # operação quando o backtest começa comprado.
+    primeira = grupo.cumcount().to_numpy() == 0
+    mudanca = df["mudanca"]
+    operacao = (mudanca.eq(Position.SHORT) & ~primeira) | mudanca.eq(Position.LONG)
+
+    posicao = mudanca.where(operacao).groupby(grupos).ffill()
+    exposto = posicao.eq(Position.LONG)
+
+    operacoes = df.loc[operacao, chaves + ["mudanca", "dinheiro"]]
+    anteriores = operacoes.groupby(chaves)[["mudanca", "dinheiro"]].shift()
+    encerradas = operacoes["mudanca"].eq(Position.SHORT) & anteriores["mudanca"].eq(
+        Position.LONG
+    )
+    acerto = (operacoes["dinheiro"] > anteriores["dinheiro"])[encerradas]
+
+    periodos = grupo.size()
+    if periodos_por_ano is None:
+        # Dia local do pregão; sem o fuso, o floor não esbarra em horário de verão.
+        data = df["date"]
+        if data.dt.tz is not None:
+            data = data.dt.tz_localize(None)
+        dias = data.dt.floor("D").groupby(grupos).nunique()
+        periodos_por_ano = DIAS_POR_ANO * periodos / dias
+    quantidade = operacao.groupby(grupos).sum()
+    tabela = pd.DataFrame(
+        {
+            "periodos": periodos,
+            "valor_final": grupo["dinheiro"].last(),
+            "buy_and_hold": grupo["bnh"].last(),
+            "retorno": 100 * (grupo["dinheiro"].last() / grupo["dinheiro"].first() - 1),
+            "retorno_bnh": 100 * (grupo["bnh"].last() / grupo["bnh"].first() - 1),
+            "sharpe": retorno.groupby(grupos).mean()
+            / retorno.groupby(grupos).std()
+            * np.sqrt(periodos_por_ano),
+            "max_drawdown": 100 * drawdown.groupby(grupos).min(),
+            "operacoes": quantidade,
+            "turnover": quantidade / periodos * periodos_por_ano,
+            "taxa_acerto": acerto.groupby(
+                [operacoes.loc[encerradas, chave] for chave in chaves]
+            ).mean(),
+            "exposicao": exposto.groupby(grupos).mean(),
+        }
+    )
+    return tabela.reset_index()
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--ticker", dest="ticker", type=str, nargs="+")
+parser.add_argument("--periodos-por-ano", dest="periodos_por_ano", type=int)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    metricas = calcular_metricas(
+        ler_resultados(args.ticker), periodos_por_ano=args.periodos_por_ano
+    )
+
+    caminho = f"{STRATEGY_PATH}/metricas-consolidadas.parquet"
+    metricas.to_parquet(caminho, index=False)
+    logger.info(f"backtests={len(metricas)} path={caminho}")
+    print(metricas.to_string(index=False))
@@ -0,0 +1,442 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import default as politica_email
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from logs import get_logger
+
+logger = get_logger()
+
+DECISOES = ("LONG", "SHORT", "UNKNOWN")
+
+
+class EstadoFalso:
+    """Arquivos e batches em memória, com o ciclo de vida dos batches
+    simulado a partir do tempo desde a criação:
+
+    validating -> in_progress -> finalizing -> completed | expired
+
+    Batches sorteados como inválidos falham na validação com o erro
+    `invalid_type`. A saída de cada requisição é uma `RespostaLLM` sintética,
+    determinística pelo `custom_id`; as requisições sorteadas como falhas vão
+    para o arquivo de erros do batch."""
+
+    def __init__(
+        self,
+        duracao: float = 2.0,
+        taxa_429: float = 0.0,
+        taxa_invalido: float = 0.0,
+        taxa_expirado: float = 0.0,
+        taxa_falha_linha: float = 0.0,
+        semente: int | None = None,
+    ):
+        self.duracao = duracao
+        self.taxa_429 = taxa_429
+        self.taxa_invalido = taxa_invalido
+        self.taxa_expirado = taxa_expirado
+        self.taxa_falha_linha = taxa_falha_linha
+        self.aleatorio = random.Random(semente)
+        self.arquivos: dict[str, dict] = {}
+        self.conteudos: dict[str, bytes] = {}
+        self.batches: dict[str, dict] = {}
+        self.trava = threading.RLock()
+
+    def limitar(self) -> bool:
+        with self.trava:
+            return self.aleatorio.random() < self.taxa_429
+
+    def criar_arquivo(self, nome: str, proposito: str, conteudo: bytes) -> dict:
+        arquivo = {
+            "id": f"file-{uuid.uuid4().hex}",
+            "object": "file",
+            "bytes": len(conteudo),
+            "created_at": int(time.time()),
+            "filename": nome,
+            "purpose": proposito,
+            "status": "processed",
+        }
+        with self.trava:
+            self.arquivos[arquivo["id"]] = arquivo
+            self.conteudos[arquivo["id"]] = conteudo
+        return arquivo
+
+    def criar_batch(self, input_file_id: str, endpoint: str, janela: str) -> dict:
+        with self.trava:
+            if input_file_id not in self.arquivos:
+                return None
+            total = self.conteudos[input_file_id].count(b"\n")
+            sorteio = self.aleatorio.random()
+
+        if sorteio < self.taxa_invalido:
+            destino = "invalido"
+        elif sorteio < self.taxa_invalido + self.taxa_expirado:
+            destino = "expired"
+        else:
+            destino = "completed"
+
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": endpoint,
+            "errors": None,
+            "input_file_id": input_file_id,
+            "completion_window": janela,
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "request_counts": {"total": total, "completed": 0, "failed": 0},
+            "_inicio": time.monotonic(),
+            "_destino": destino,
+        }
+        with self.trava:
+            self.batches[batch["id"]] = batch
+        return self.publico(batch)
+
+    def publico(self, batch: dict) -> dict:
+        return {k: v for k, v in batch.items() if not k.startswith("_")}
+
+    def avancar(self, batch: dict):
+        """Atualiza o status do batch conforme o tempo decorrido."""
+        if batch["status"] in ("completed", "failed", "expired", "cancelled"):
+            return
+
+        decorrido = time.monotonic() - batch["_inicio"]
+        validacao = 0.1 * self.duracao
+        contagem = batch["request_counts"]
+
+        if decorrido < validacao:
+            return
+
+        if batch["_destino"] == "invalido":
+            batch["status"] = "failed"
+            batch["errors"] = {
+                "object": "list",
+                "data": [
+                    {
+                        "code": "invalid_type",
+                        "message": "Invalid type for 'messages[1].content'.",
+                        "param": "body.messages[1].content",
+                        "line": 1,
+                    }
+                ],
+            }
+        elif decorrido < self.duracao:
+            batch["status"] = "in_progress"
+            fracao = (decorrido - validacao) / (self.duracao - validacao)
+            contagem["completed"] = int(contagem["total"] * fracao)
+        elif decorrido < 1.1 * self.duracao:
+            batch["status"] = "finalizing"
+            contagem["completed"] = contagem["total"]
+        elif batch["_destino"] == "expired":
+            batch["status"] = "expired"
+        else:
+            saida, erros = self.gerar_saida(self.conteudos[batch["input_file_id"]])
+            arquivo = self.criar_arquivo(
+                f"{batch['id']}_output.jsonl", "batch_output", saida
+            )
+            batch["output_file_id"] = arquivo["id"]
+            if erros:
+                arquivo = self.criar_arquivo(
+                    f"{batch['id']}_error.jsonl", "batch_output", erros
+                )
+                batch["error_file_id"] = arquivo["id"]
+                contagem["failed"] = erros.count(b"\n")
+                contagem["completed"] -= contagem["failed"]
+            batch["status"] = "completed"
+
+    def gerar_erro(self, custom_id: str) -> str:
+        return json.dumps(
+            {
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": custom_id,
+                "response": {
+                    "status_code": 500,
+                    "request_id": uuid.uuid4().hex,
+                    "body": {
+                        "error": {
+                            "message": "Erro sintético do servidor falso.",
+                            "type": "server_error",
+                        }
+                    },
+                },
+                "error": None,
+            }
+        )
+
+    def gerar_saida(self, entrada: bytes) -> tuple[bytes, bytes]:
+        """Conteúdo dos arquivos de saída e de erros do batch."""
+        linhas = []
+        erros = []
+        for linha in entrada.splitlines():
+            custom_id = json.loads(linha)["custom_id"]
+            with self.trava:
+                falhou = self.aleatorio.random() < self.taxa_falha_linha
+            if falhou:
+                erros.append(self.gerar_erro(custom_id))
+                continue
+
+            semente = hashlib.sha256(custom_id.encode()).digest()[0]
+            resposta = {
+                "decisao": DECISOES[semente % len(DECISOES)],
+                "motivo": "Resposta sintética do servidor falso.",
+            }
+            corpo = {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": json.dumps(resposta, ensure_ascii=False),
+                        },
+                        "finish_reason": "stop",
+                    }
+                ],
+            }
+            linhas.append(
+                json.dumps(
+                    {
+                        "id": f"batch_req_{uuid.uuid4().hex}",
+                        "custom_id": custom_id,
+                        "response": {
+                            "status_code": 200,
+                            "request_id": uuid.uuid4().hex,
+                            "body": corpo,
+                        },
+                        "error": None,
+                    },
+                    ensure_ascii=False,
+                )
+            )
+        return (
+            "".join(f"{linha}\n" for linha in linhas).encode(),
+            "".join(f"{erro}\n" for erro in erros).encode(),
+        )
+
+    def obter_batch(self, batch_id: str) -> dict | None:
+        with self.trava:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            self.avancar(batch)
+            return self.publico(batch)
+
+    def listar_batches(self, limite: int, depois: str | None) -> dict:
+        with self.trava:
+            ids = list(reversed(self.batches))
+            inicio = ids.index(depois) + 1 if depois in self.batches else 0
+            pagina = ids[inicio : inicio + limite]
+            for batch_id in pagina:
+                self.avancar(self.batches[batch_id])
+            data = [self.publico(self.batches[batch_id]) for batch_id in pagina]
+
+        return {
+            "object": "list",
+            "data": data,
+            "first_id": pagina[0] if pagina else None,
+            "last_id": pagina[-1] if pagina else None,
+            "has_more": inicio + limite < len(ids),
+        }
+
+
+class ManipuladorFalso(BaseHTTPRequestHandler):
+    """Rotas de `/v1/files` e `/v1/batches` usadas pelo projeto."""
+
+    estado: EstadoFalso
+    latencia: float = 0.0
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_):
+        pass
+
+    def responder(self, status: int, corpo: dict | bytes):
+        if isinstance(corpo, dict):
+            dados = json.dumps(corpo).encode()
+            tipo = "application/json"
+        else:
+            dados = corpo
+            tipo = "application/octet-stream"
+
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def erro(self, status: int, mensagem: str, codigo: str | None = None):
+        self.responder(
+            status,
+            {
+                "error": {
+                    "message": mensagem,
+                    "type": "invalid_request_error",
+                    "param": None,
+                    "code": codigo,
+                }
+            },
+        )
+
+    def ler_corpo(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def antes(self) -> bool:
+        """Aplica a latência e a injeção de 429. Retorna False se a requisição
+        já foi respondida com erro."""
+        if self.latencia:
+            time.sleep(self.latencia)
+        if self.estado.limitar():
+            self.erro(429, "Rate limit reached.", "rate_limit_exceeded")
+            return False
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        partes = url.path.strip("/").split("/")
+        self.ler_corpo()
+
+        if not self.antes():
+            return
+
+        if partes == ["v1", "files"]:
+            with self.estado.trava:
+                data = list(self.estado.arquivos.values())
+            self.responder(200, {"object": "list", "data": data, "has_more": False})
+        elif partes[:2] == ["v1", "files"] and len(partes) in (3, 4):
+            file_id = partes[2]
+            with self.estado.trava:
+                arquivo = self.estado.arquivos.get(file_id)
+                conteudo = self.estado.conteudos.get(file_id)
+            if arquivo is None:
+                self.erro(404, f"No such File object: {file_id}")
+            elif len(partes) == 4 and partes[3] == "content":
+                self.responder(200, conteudo)
+            else:
+                self.responder(200, arquivo)
+        elif partes == ["v1", "batches"]:
+            query = parse_qs(url.query)
+            limite = int(query.get("limit", ["20"])[0])
+            depois = query.get("after", [None])[0]
+            self.responder(200, self.estado.listar_batches(limite, depois))
+        elif partes[:2] == ["v1", "batches"] and len(partes) == 3:
+            batch = self.estado.obter_batch(partes[2])
+            if batch is None:
+                self.erro(404, f"No batch found with id '{partes[2]}'.")
+            else:
+                self.responder(200, batch)
+        else:
+            self.erro(404, f"Rota inexistente: {url.path}")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        corpo = self.ler_corpo()
+
+        if not self.antes():
+            return
+
+        if url.path == "/v1/files":
+            mensagem = BytesParser(policy=politica_email).parsebytes(
+                b"Content-Type: "
+                + self.headers["Content-Type"].encode()
+                + b"\r\n\r\n"
+                + corpo
+            )
+            campos = {}
+            for parte in mensagem.iter_parts():
+                nome = parte.get_param("name", header="content-disposition")
+                campos[nome] = (parte.get_filename(), parte.get_payload(decode=True))
+
+            nome_arquivo, conteudo = campos["file"]
+            proposito = campos["purpose"][1].decode()
+            self.responder(
+                200, self.estado.criar_arquivo(nome_arquivo, proposito, conteudo)
+            )
+        elif url.path == "/v1/batches":
+            dados = json.loads(corpo)
+            batch = self.estado.criar_batch(
+                dados["input_file_id"], dados["endpoint"], dados["completion_window"]
+            )
+            if batch is None:
+                self.erro(400, "Invalid input_file_id.", "invalid_request")
+            else:
+                self.responder(200, batch)
+        else:
+            self.erro(404, f"Rota inexistente: {url.path}")
+
+
+class ServidorFalso:
+    """Servidor local que imita as APIs de Files e Batches da OpenAI. Pode ser
+    iniciado em uma thread (testes e benchmark) ou pela linha de comando.
+
+    Para apontar os clientes para ele: `OPENAI_BASE_URL={servidor.url}`."""
+
+    def __init__(
+        self,
+        porta: int = 0,
+        latencia: float = 0.0,
+        estado: EstadoFalso | None = None,
+    ):
+        manipulador = type(
+            "Manipulador",
+            (ManipuladorFalso,),
+            {"estado": estado or EstadoFalso(), "latencia": latencia},
+        )
+        self.estado = manipulador.estado
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", porta), manipulador)
+        self.servidor.daemon_threads = True
+        self.thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, porta = self.servidor.server_address[:2]
+        return f"http://{host}:{porta}/v1"
+
+    def iniciar(self):
+        self.thread = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def parar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *_):
+        self.parar()
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--porta", dest="porta", type=int, default=8099)
+parser.add_argument("--latencia", dest="latencia", type=float, default=0.0)
+parser.add_argument("--duracao", dest="duracao", type=float, default=2.0)
+parser.add_argument("--taxa-429", dest="taxa_429", type=float, default=0.0)
+parser.add_argument("--taxa-invalido", dest="taxa_invalido", type=float, default=0.0)
+parser.add_argument("--taxa-expirado", dest="taxa_expirado", type=float, default=0.0)
+parser.add_argument(
+    "--taxa-falha-linha", dest="taxa_falha_linha", type=float, default=0.0
+)
+parser.add_argument("--semente", dest="semente", type=int)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    estado = EstadoFalso(
+        duracao=args.duracao,
+        taxa_429=args.taxa_429,
+        taxa_invalido=args.taxa_invalido,
+        taxa_expirado=args.taxa_expirado,
+        taxa_falha_linha=args.taxa_falha_linha,
+        semente=args.semente,
+    )
+    servidor = ServidorFalso(args.porta, args.latencia, estado)
+    logger.info(f"servidor_falso url={servidor.url}")
+    servidor.servidor.serve_forever()
@@ -0,0 +1,185 @@
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from logs import get_logger
+
+logger = get_logger()
+
+CAMINHO_PRECOS = "data/tickers2"
+CAMINHO_ARMAZEM = "data/precos"
+
+COLUNAS_PRECO = {
+    "Date": "date",
+    "Datetime": "date",
+    "Open": "open",
+    "Close": "close",
+    "High": "high",
+    "Low": "low",
+    "Volume": "volume",
+    "Dividends": "dividends",
+    "Stock Splits": "stock_splits",
+}
+
+# Colunas guardadas no armazém, na ordem das linhas da matriz de valores.
+COLUNAS_VALORES = [
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "dividends",
+    "stock_splits",
+]
+
+
+def ler_arquivo_precos(caminho: str) -> pd.DataFrame:
+    """Lê um parquet de preços com os nomes de coluna normalizados."""
+    return pd.read_parquet(caminho).reset_index().rename(columns=COLUNAS_PRECO)
+
+
+def _fontes(origem: str) -> dict[str, int]:
+    """Arquivos de preço da origem (nome da série -> mtime em ns)."""
+    return {
+        nome.removesuffix(".parquet"): os.stat(f"{origem}/{nome}").st_mtime_ns
+        for nome in sorted(os.listdir(origem))
+        if nome.endswith(".parquet")
+    }
+
+
+class ArmazemPrecos:
+    """Histórico de preços de todas as séries (`{ticker}` diário e
+    `{ticker}-hora`) em um único armazém colunar em `CAMINHO_ARMAZEM`:
+
+    - `datas.npy`: início de cada barra, em ns desde a época (UTC);
+    - `valores.npy`: matriz [COLUNAS_VALORES, linha] em float64;
+    - `indice.json`: intervalo de linhas, fuso e colunas de cada série, em
+      ordem de data, e o mtime dos parquets usados.
+
+    Os arrays são abertos com mmap, então os processos de um pool dividem as
+    mesmas páginas. O armazém é reconstruído sozinho quando algum parquet em
+    `CAMINHO_PRECOS` é criado, removido ou alterado. A verificação, a
+    reconstrução e a abertura acontecem sob uma trava de arquivo, então dois
+    processos nunca reconstroem ao mesmo tempo nem abrem um índice de uma
+    versão com os arrays de outra."""
+
+    def __init__(self, caminho: str = CAMINHO_ARMAZEM, origem: str = CAMINHO_PRECOS):
+        self.caminho = caminho
+        os.makedirs(caminho, exist_ok=True)
+        with self._travar():
+            fontes = _fontes(origem)
+            if self._ler_indice().get("fontes") != fontes:
+                self.construir(origem, fontes)
+
+            self.indice = self._ler_indice()["series"]
+            self.datas = np.load(f"{caminho}/datas.npy", mmap_mode="r")
+            self.valores = np.load(f"{caminho}/valores.npy", mmap_mode="r")
+
+    @contextmanager
+    def _travar(self):
+        with open(f"{self.caminho}/.trava", "w") as trava:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(trava, fcntl.LOCK_UN)
+
+    def _ler_indice(self) -> dict:
+        try:
+            with open(f"{self.caminho}/indice.json") as arquivo:
+                return json.load(arquivo)
+        except FileNotFoundError:
+            return {}
+
+    def construir(self, origem: str, fontes: dict[str, int]):
+        """Lê todos os parquets da origem e grava o armazém. O índice é gravado
+        por último, então um armazém incompleto nunca é usado. Deve ser
+        chamado com a trava do armazém."""
+        precos = {
+            nome: ler_arquivo_precos(f"{origem}/{nome}.parquet") for nome in fontes
+        }
+        total = sum(len(df) for df in precos.values())
+
+        datas = np.empty(total, dtype=np.int64)
+        valores = np.full((len(COLUNAS_VALORES), total), np.nan)
+        series = {}
+        inicio = 0
+        for nome, df in precos.items():
+            df = df.sort_values("date")
+            fim = inicio + len(df)
+            date = df["date"]
+            tz = str(date.dt.tz) if date.dt.tz is not None else None
+            if tz:
+                date = date.dt.tz_convert("UTC").dt.tz_localize(None)
+
+            datas[inicio:fim] = date.dt.as_unit("ns").to_numpy().view(np.int64)
+            colunas = [c for c in COLUNAS_VALORES if c in df.columns]
+            for coluna in colunas:
+                linha = COLUNAS_VALORES.index(coluna)
+                valores[linha, inicio:fim] = df[coluna].to_numpy(dtype=np.float64)
+
+            series[nome] = {"inicio": inicio, "fim": fim, "tz": tz, "colunas": colunas}
+            inicio = fim
+
+        for nome, array in (("datas", datas), ("valores", valores)):
+            with open(f"{self.caminho}/{nome}.npy.tmp", "wb") as arquivo:
+                np.save(arquivo, array)
+            os.replace(f"{self.caminho}/{nome}.npy.tmp", f"{self.caminho}/{nome}.npy")
+        with open(f"{self.caminho}/indice.json.tmp", "w") as arquivo:
+            json.dump({"fontes": fontes, "series": series}, arquivo)
+        os.replace(f"{self.caminho}/indice.json.tmp", f"{self.caminho}/indice.json")
+
+        logger.info(f"armazem_precos=construido series={len(series)} linhas={total}")
+
+    def series(self) -> list[str]:
+        return list(self.indice)
+
+    def _posicao(self, data, tz: str | None) -> int:
+        data = pd.Timestamp(data)
+        if tz and data.tz is None:
+            data = data.tz_localize(tz)
+        if data.tz is not None:
+            data = data.tz_convert("UTC").tz_localize(None)
+        return data.as_unit("ns").value
+
+    def ler(
+        self,
+        ticker: str,
+        inicio=None,
+        fim=None,
+        colunas: list[str] | None = None,
+    ) -> pd.DataFrame:
+        """Preços da série entre `inicio` e `fim` (inclusive), com a coluna
+        date no fuso original. Datas sem fuso são interpretadas no fuso da
+        série. Sem `colunas`, traz todas as que o parquet original tinha."""
+        serie = self.indice[ticker]
+        a, b, tz = serie["inicio"], serie["fim"], serie["tz"]
+
+        datas = self.datas[a:b]
+        if inicio is not None:
+            a += int(np.searchsorted(datas, self._posicao(inicio, tz), side="left"))
+        if fim is not None:
+            b = serie["inicio"] + int(
+                np.searchsorted(datas, self._posicao(fim, tz), side="right")
+            )
+
+        date = pd.to_datetime(np.asarray(self.datas[a:b]), unit="ns")
+        if tz:
+            date = date.tz_localize("UTC").tz_convert(tz)
+
+        df = pd.DataFrame({"date": date})
+        for coluna in colunas or serie["colunas"]:
+            linha = COLUNAS_VALORES.index(coluna)
+            df[coluna] = np.asarray(self.valores[linha, a:b])
+        return df
+
+
+@lru_cache
+def get_armazem() -> ArmazemPrecos:
+    """Armazém do processo, aberto uma única vez."""
+    return ArmazemPrecos()
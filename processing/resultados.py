@@ -0,0 +1,89 @@
+from typing import Iterable
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from config import MODELO
+from database import ResultadoBatch, criar_tabelas, sqlite_engine
+
+# Quantidade de chaves por consulta, abaixo do limite de variáveis do SQLite.
+TAMANHO_CONSULTA = 500
+
+COLUNAS_RESULTADO = [
+    "ticker",
+    "hash_id",
+    "decisao",
+    "motivo",
+    "batch_id",
+    "custom_id",
+    "chave",
+]
+COLUNAS_ATUALIZADAS = ["decisao", "motivo", "modelo", "batch_id", "custom_id", "chave"]
+
+
+class ResultadosBatch:
+    """Resultados dos batches indexados por (ticker, hash_id), no mesmo banco
+    dos BatchLogs. Cada saída é carregada uma única vez, e as consultas não
+    precisam reler os JSONL."""
+
+    def __init__(self):
+        criar_tabelas()
+
+    def salvar(self, resultados: pd.DataFrame, modelo: str = MODELO):
+        """Salva os resultados (colunas de COLUNAS_RESULTADO). Quando a mesma
+        notícia aparece mais de uma vez para o ticker, vale a última."""
+        registros = (
+            resultados[COLUNAS_RESULTADO]
+            .drop_duplicates(["ticker", "hash_id"], keep="last")
+            .assign(modelo=modelo)
+            .to_dict("records")
+        )
+        if not registros:
+            return
+
+        with Session(sqlite_engine) as session:
+            for inicio in range(0, len(registros), TAMANHO_CONSULTA):
+                stmt = insert(ResultadoBatch).values(
+                    registros[inicio : inicio + TAMANHO_CONSULTA]
+                )
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[ResultadoBatch.ticker, ResultadoBatch.hash_id],
+                    set_={c: stmt.excluded[c] for c in COLUNAS_ATUALIZADAS},
+                )
+                session.execute(stmt)
+            session.commit()
+
+    def obter(self, ticker: str) -> pd.DataFrame:
+        """Resultados do ticker (colunas hash_id, decisao, motivo, custom_id e
+        chave)."""
+        colunas = ["hash_id", "decisao", "motivo", "custom_id", "chave"]
+        stmt = select(*(getattr(ResultadoBatch, c) for c in colunas)).where(
+            ResultadoBatch.ticker == ticker.lower()
+        )
+        with Session(sqlite_engine) as session:
+            linhas = session.execute(stmt).all()
+
+        return pd.DataFrame(linhas, columns=colunas)
+
+    def obter_noticias(self, hash_ids: Iterable[str]) -> pd.DataFrame:
+        """Decisões de todos os tickers para as notícias (colunas ticker,
+        hash_id, decisao, motivo)."""
+        hash_ids = list(dict.fromkeys(hash_ids))
+        linhas = []
+        with Session(sqlite_engine) as session:
+            for inicio in range(0, len(hash_ids), TAMANHO_CONSULTA):
+                stmt = select(
+                    ResultadoBatch.ticker,
+                    ResultadoBatch.hash_id,
+                    ResultadoBatch.decisao,
+                    ResultadoBatch.motivo,
+                ).where(
+                    ResultadoBatch.hash_id.in_(
+                        hash_ids[inicio : inicio + TAMANHO_CONSULTA]
+                    )
+                )
+                linhas.extend(session.execute(stmt).all())
+
+        return pd.DataFrame(linhas, columns=["ticker", "hash_id", "decisao", "motivo"])
@@ -1,166 +1,183 @@
 import os
-from typing import TypedDict
+import json
 import argparse
-from matplotlib.gridspec import GridSpec
 import pandas as pd
-import matplotlib.pyplot as plt
-import math
 from logs import get_logger
-from config import STRATEGY_PATH, GRAPH_PATH
+from config import STRATEGY_PATH
+from backtest_engine import (
+    EstadoBacktest,
+    executar_backtest,
+    executar_backtest_iterativo,
+)
+from estrategia import METODOS_AGREGACAO
+from precos import CAMINHO_PRECOS
+from sweep import NUM_WORKERS, executar_sweep
 
-
-class Position:
-    LONG = "LONG"
-    SHORT = "SHORT"
-    UNKNOWN = "UNKNOWN"
+logger = get_logger()
 
 
-class Entry(TypedDict):
-    open: float
-    close: float
-    posicao: str
+def get_estado_path(ticker: str):
+    return f"{STRATEGY_PATH}/{ticker}-estado.json"
 
 
-logger = get_logger()
+def get_resultado_path(ticker: str):
+    return f"{STRATEGY_PATH}/{ticker}-resultado.parquet"
 
 
-def plotar_retornos(ticker: str, df: pd.DataFrame):
-    df = df.set_index(["date"])
+def ler_estado(ticker: str) -> EstadoBacktest | None:
+    try:
+        with open(get_estado_path(ticker)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
 
-    mask_long = df["mudanca"] == "LONG"
-    mask_short = df["mudanca"] == "SHORT"
 
-    df_long = df[mask_long]
-    df_short = df[mask_short]
+def salvar_estado(ticker: str, estado: EstadoBacktest):
+    with open(get_estado_path(ticker), "w") as f:
+        json.dump(estado, f)
 
-    fig = plt.figure(figsize=(18, 10), dpi=140)
-    gs = GridSpec(2, 1, height_ratios=[1.5, 0.5])
-    ax1 = fig.add_subplot(gs[0, 0])
-    ax2 = fig.add_subplot(gs[1, 0])
 
-    ax1.plot(df.index, df["dinheiro"], color="#377EB8", lw=2)
-    ax1.plot(df.index, df["bnh"], color="#2C3E50", ls="--", lw=2)
-    ax1.scatter(df_long.index, df_long["dinheiro"], s=50, zorder=5, color="#4DAF4A")
-    ax1.scatter(df_short.index, df_short["dinheiro"], s=50, zorder=5, color="#E74C3C")
-
-    def get_color(x):
-        if x["retornos"] >= 0:
-            return "#4DAF4A"
-        return "#E74C3C"
+def backtest(ticker: str, valor_inicial: float = 1000):
+    df = pd.read_parquet(f"{STRATEGY_PATH}/{ticker}.parquet")
 
-    df["color"] = df.apply(get_color, axis=1)
-    ax2.bar(df.index, df["retornos"], color=df["color"])
+    print(f"Valor inicial: {valor_inicial}")
 
-    ax1.spines["right"].set_visible(False)
-    ax1.spines["top"].set_visible(False)
-    ax1.set_ylabel("Retorno (R$)")
-    ax1.set_xlabel("Data")
+    df, balance, buy_n_hold, estado = executar_backtest(df, valor_inicial)
 
-    ax2.spines["right"].set_visible(False)
-    ax2.spines["top"].set_visible(False)
-    ax2.set_ylabel("Retorno (%)")
-    ax2.set_xlabel("Data")
+    logger.info(
+        f"ticker={ticker} valor_inicial={valor_inicial} valor_final={balance} buy_and_hold={buy_n_hold}"
+    )
 
-    plt.tight_layout()
-    fig.savefig(f"{GRAPH_PATH}/{ticker}.png")
+    df.to_parquet(get_resultado_path(ticker), engine="fastparquet")
+    salvar_estado(ticker, estado)
+    return ticker
 
 
-def get_amount_of_shares(balance: float, open: float):
-    shares = math.floor(balance / open)
-    invested_value = shares * open
-    return shares, invested_value
+def backtest_incremental(ticker: str, valor_inicial: float = 1000):
+    """Continua o backtest a partir do estado salvo, processando apenas os dias
+    posteriores ao último dia já presente em `{ticker}-resultado.parquet`.
+    Sem estado salvo, executa o backtest completo."""
 
+    estado = ler_estado(ticker)
+    if not estado or not os.path.isfile(get_resultado_path(ticker)):
+        return backtest(ticker, valor_inicial)
 
-def backtest(ticker: str):
     df = pd.read_parquet(f"{STRATEGY_PATH}/{ticker}.parquet")
-    data: list[Entry] = df.to_dict("records")
-
-    valor_inicial = 1000
-    balance = valor_inicial
-    print(f"Valor inicial: {balance}")
-
-    first_day = data[0]
-    current_position = first_day["posicao"]
-    current_shares, invested_value = (
-        get_amount_of_shares(balance, first_day["open"])
-        if current_position == "LONG"
-        else (0, 0)
+    df = df[df["date"] > pd.Timestamp(estado["data"])]
+    if df.empty:
+        logger.info(f"ticker={ticker} status=sem_novos_dias")
+        return None
+
+    df.index = pd.RangeIndex(estado["linhas"], estado["linhas"] + len(df))
+    df, balance, buy_n_hold, estado = executar_backtest(
+        df, estado["valor_inicial"], estado
     )
 
-    balance -= invested_value
-
-    buy_n_hold = balance + invested_value
-    dinheiro = []
-    bnh = []
-    retornos = [0]
-    mudanca = [current_position]
-    posicoes = [current_position]
+    logger.info(
+        f"ticker={ticker} novos_dias={len(df)} valor_final={balance} buy_and_hold={buy_n_hold}"
+    )
 
-    dinheiro.append(balance + invested_value)
-    bnh.append(buy_n_hold)
+    df.to_parquet(get_resultado_path(ticker), engine="fastparquet", append=True)
+    salvar_estado(ticker, estado)
+    return ticker
 
-    for entry in data[1:]:
-        todays_return = entry["open"] / entry["close"]
-        buy_n_hold = buy_n_hold * todays_return
-        mudanca_posicao = None
 
-        if current_position == Position.LONG:
-            invested_value = invested_value * todays_return
+def backtest_intraday(ticker: str, valor_inicial: float = 1000):
+    """Backtest sobre as barras de 1h, com cada notícia alinhada à próxima
+    barra negociável."""
+    # Importado aqui para que os demais modos não dependam do nltk (via utils).
+    from intraday import get_df_final_intraday
 
-        if entry["posicao"] == Position.SHORT and current_position in [Position.LONG]:
-            balance += invested_value
-            invested_value = 0
-            current_shares = 0
-            mudanca_posicao = entry["posicao"]
+    noticias = pd.read_parquet(f"{STRATEGY_PATH}/{ticker}-completo.parquet")
+    df = get_df_final_intraday(ticker, noticias)
+    df.to_parquet(f"{STRATEGY_PATH}/{ticker}-hora.parquet")
 
-        if entry["posicao"] == Position.LONG and current_position in [
-            Position.SHORT,
-        ]:
-            current_shares, invested_value = get_amount_of_shares(
-                balance, entry["open"]
-            )
-            balance -= invested_value
-            mudanca_posicao = entry["posicao"]
+    df, balance, buy_n_hold, _ = executar_backtest(df, valor_inicial)
 
-        dinheiro.append(balance + invested_value)
-        bnh.append(buy_n_hold)
-        mudanca.append(mudanca_posicao)
+    logger.info(
+        f"ticker={ticker} barras={len(df)} valor_inicial={valor_inicial} valor_final={balance} buy_and_hold={buy_n_hold}"
+    )
 
-        retornos.append((dinheiro[-1] / valor_inicial) - 1)
+    nome = f"{ticker}-hora"
+    df.to_parquet(get_resultado_path(nome), engine="fastparquet")
+    return nome
 
-        if nova_posicao := entry.get("posicao"):
-            if nova_posicao != Position.UNKNOWN:
-                current_position = entry["posicao"].strip()
-        posicoes.append(current_position)
 
-    balance += invested_value
+def verificar(ticker: str, valor_inicial: float = 1000):
+    """Confere se o motor vetorizado reproduz exatamente o loop original."""
+    df = pd.read_parquet(f"{STRATEGY_PATH}/{ticker}.parquet")
 
-    logger.info(
-        f"ticker={ticker} valor_inicial={valor_inicial} valor_final={balance} buy_and_hold={buy_n_hold}"
+    esperado, valor_esperado, bnh_esperado = executar_backtest_iterativo(
+        df.copy(), valor_inicial
     )
+    obtido, valor_obtido, bnh_obtido, _ = executar_backtest(df.copy(), valor_inicial)
+
+    pd.testing.assert_frame_equal(obtido, esperado, check_exact=True, check_dtype=False)
+    assert valor_obtido == valor_esperado and bnh_obtido == bnh_esperado
+    logger.info(f"ticker={ticker} status=resultados_identicos")
+    return None
 
-    df["dinheiro"] = dinheiro
-    df["bnh"] = bnh
-    df["mudanca"] = mudanca
-    df["retornos"] = retornos
-    df["retornos"] = 100 * df["retornos"]
 
-    df.to_parquet(f"{STRATEGY_PATH}/{ticker}-resultado.parquet")
-    plotar_retornos(ticker, df)
+def tickers_com_noticias() -> list[str]:
+    """Tickers que possuem decisões classificadas (`{ticker}-completo.parquet`)."""
+    return sorted(
+        f.removesuffix("-completo.parquet")
+        for f in os.listdir(STRATEGY_PATH)
+        if f.endswith("-completo.parquet")
+    )
 
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--ticker", dest="ticker", type=str)
+parser.add_argument("--valor-inicial", dest="valor_inicial", type=float, default=1000)
+parser.add_argument("--verificar", dest="verificar", action="store_true")
+parser.add_argument("--incremental", dest="incremental", action="store_true")
+parser.add_argument("--intraday", dest="intraday", action="store_true")
+parser.add_argument("--sweep", dest="sweep", action="store_true")
+parser.add_argument(
+    "--capitais", dest="capitais", type=float, nargs="+", default=[1000]
+)
+parser.add_argument(
+    "--metodos",
+    dest="metodos",
+    nargs="+",
+    choices=list(METODOS_AGREGACAO),
+    default=list(METODOS_AGREGACAO),
+)
+parser.add_argument("--workers", dest="workers", type=int, default=NUM_WORKERS)
+parser.add_argument("--graficos", dest="graficos", action="store_true")
 if __name__ == "__main__":
     args = parser.parse_args()
     ticker = args.ticker
-    if not ticker:
+    executar = backtest
+    if args.verificar:
+        executar = verificar
+    elif args.incremental:
+        executar = backtest_incremental
+    elif args.intraday:
+        executar = backtest_intraday
+
+    resultados = []
+    if args.sweep:
+        tickers = [ticker] if ticker else tickers_com_noticias()
+        executar_sweep(tickers, args.capitais, args.metodos, args.workers)
+    elif args.intraday and not ticker:
+        for ticker in tickers_com_noticias():
+            if os.path.isfile(f"{CAMINHO_PRECOS}/{ticker}-hora.parquet"):
+                resultados.append(executar(ticker, args.valor_inicial))
+    elif not ticker:
         tickers = os.listdir(STRATEGY_PATH)
         for ticker_file in tickers:
             if "-" in ticker_file:
                 continue
 
             ticker = ticker_file.split(".")[0]
-            backtest(ticker)
+            resultados.append(executar(ticker, args.valor_inicial))
     else:
-        backtest(ticker)
+        resultados.append(executar(ticker, args.valor_inicial))
+
+    if args.graficos:
+        # Só importa o matplotlib quando os gráficos são solicitados.
+        from graficos import renderizar_graficos
+
+        renderizar_graficos([nome for nome in resultados if nome])
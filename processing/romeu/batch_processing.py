@@ -1,22 +1,42 @@
+import asyncio
+from dataclasses import dataclass, field
 from datetime import datetime
+import hashlib
 import json
 from multiprocessing import Process
 import os
 from typing import TypedDict
-import pandas as pd
-from openai import BadRequestError, NotFoundError, OpenAI
+from fastparquet import ParquetFile
+from openai import BadRequestError, OpenAI
 from decouple import config
 from openai.lib._parsing._completions import type_to_response_format_param
-from sqlalchemy import delete, null, select
-from dto import RespostaLLM
-from config import SYSTEM_PROMPT, USER_PROMPT
-from apscheduler.schedulers.blocking import BlockingScheduler
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import NoResultFound, MultipleResultsFound
-from database import sqlite_engine, BatchLog
+from sqlalchemy import func, null, select
+from sqlalchemy.orm import aliased
+from dto import RespostaLLM, RespostaMultiTicker
+from config import MODELO, TICKER_MULTI
+from cache_llm import (
+    CacheLLM,
+    get_chave,
+    get_system_prompt,
+    get_system_prompt_multi,
+    get_tickers_prompt_multi,
+    get_user_prompts,
+)
+from sqlalchemy.orm import Session as SessionBanco, sessionmaker
+from database import (
+    STATUS_EM_ANDAMENTO,
+    STATUS_TERMINAIS,
+    BatchLog,
+    criar_tabelas,
+    reiniciar_conexoes,
+    sqlite_engine,
+)
+from cliente_batch import ClienteBatch, EscritorBanco
 from logs import get_logger
+from tokens import tokens_requisicoes, tokens_task
 
 response_format = type_to_response_format_param(RespostaLLM)
+response_format_multi = type_to_response_format_param(RespostaMultiTicker)
 
 
 Session = sessionmaker(bind=sqlite_engine)
@@ -24,8 +44,39 @@ session = Session()
 
 CAMINHO_NOTICIAS = "data/news/"
 NUM_WORKERS = 16
-MAX_BATCHES = 15
-MINIMUM_BATCHES = 10
+
+# Orçamento da fila de batches da OpenAI: novos batches só são enviados
+# enquanto a soma dos que estão em andamento couber nesses limites.
+ORCAMENTO_TOKENS: int = config("BATCH_ORCAMENTO_TOKENS", default=2_000_000, cast=int)
+ORCAMENTO_REQUISICOES: int = config(
+    "BATCH_ORCAMENTO_REQUISICOES", default=500_000, cast=int
+)
+
+# Intervalo entre consultas: volta ao mínimo quando algo muda e dobra,
+# até o máximo, enquanto nenhum batch termina.
+INTERVALO_MINIMO = 30
+INTERVALO_MAXIMO = 300
+
+# Limites de cada arquivo de batch (a API aceita até 50.000 requisições e 200 MB)
+MAX_REQUISICOES_POR_ARQUIVO: int = config(
+    "BATCH_MAX_REQUISICOES", default=50_000, cast=int
+)
+MAX_BYTES_POR_ARQUIVO: int = config("BATCH_MAX_BYTES", default=190_000_000, cast=int)
+# Por padrão, um arquivo sozinho nunca passa do orçamento de tokens da fila.
+MAX_TOKENS_POR_ARQUIVO: int = config(
+    "BATCH_MAX_TOKENS", default=ORCAMENTO_TOKENS, cast=int
+)
+
+COLUNAS_NOTICIA = ["date", "title", "hash_id"]
+
+# Quantas vezes as requisições que falharam em um batch completo são reenviadas.
+MAX_RETENTATIVAS_PARCIAIS: int = config(
+    "BATCH_MAX_RETENTATIVAS_PARCIAIS", default=3, cast=int
+)
+
+# Uma requisição por notícia, com a decisão de todos os tickers que a citam,
+# em vez de uma requisição por par (ticker, notícia).
+MODO_MULTI_TICKER: bool = config("BATCH_MULTI_TICKER", default=False, cast=bool)
 
 logger = get_logger()
 
@@ -39,24 +90,84 @@ class RetornoBatch(TypedDict):
     should_retry: bool | None
 
 
+class ArquivoRemoto(TypedDict):
+    id: str
+    bytes: int
+    created_at: int
+
+
+@dataclass
+class IndiceArquivos:
+    """Arquivos de batch já enviados à OpenAI, listados uma vez por rodada.
+    Pelo nome, vale o envio mais recente."""
+
+    por_id: dict[str, ArquivoRemoto] = field(default_factory=dict)
+    por_nome: dict[str, ArquivoRemoto] = field(default_factory=dict)
+
+    def adicionar(self, nome: str, arquivo: ArquivoRemoto):
+        self.por_id[arquivo["id"]] = arquivo
+        atual = self.por_nome.get(nome)
+        if atual is None or arquivo["created_at"] >= atual["created_at"]:
+            self.por_nome[nome] = arquivo
+
+
+def get_indice_arquivos(client: OpenAI) -> IndiceArquivos:
+    """Lista, paginando, os arquivos com purpose=batch da conta."""
+    indice = IndiceArquivos()
+    for arquivo in client.files.list(purpose="batch", limit=10_000):
+        if arquivo.purpose != "batch":
+            continue
+        indice.adicionar(
+            arquivo.filename,
+            ArquivoRemoto(
+                id=arquivo.id, bytes=arquivo.bytes, created_at=arquivo.created_at
+            ),
+        )
+    logger.info(f"arquivos_salvos_openai={len(indice.por_id)}")
+    return indice
+
+
+def calcular_sha256(caminho: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        while parte := arquivo.read(1 << 20):
+            sha256.update(parte)
+    return sha256.hexdigest()
+
+
+def get_arquivo_reutilizavel(
+    batch_log: BatchLog, indice: IndiceArquivos, batch_file_name: str
+) -> ArquivoRemoto | None:
+    """Arquivo já enviado que corresponde ao JSONL local: o do BatchLog ou, sem
+    ele, o último enviado com o mesmo nome. O tamanho tem que bater com o
+    local e, se o BatchLog guarda o sha256 do envio, o conteúdo também."""
+    if batch_log.file_id:
+        remoto = indice.por_id.get(batch_log.file_id)
+    else:
+        remoto = indice.por_nome.get(os.path.basename(batch_file_name))
+
+    if remoto is None or remoto["bytes"] != os.path.getsize(batch_file_name):
+        return None
+    if batch_log.file_sha256 and batch_log.file_sha256 != calcular_sha256(
+        batch_file_name
+    ):
+        return None
+    return remoto
+
+
 def get_or_upload_batch_file(
-    client: OpenAI, ticker: str, id: int, batch_file_name: str
+    client: OpenAI,
+    session: SessionBanco,
+    indice: IndiceArquivos,
+    ticker: str,
+    id: int,
+    batch_file_name: str,
 ):
-    """Cria as batch files e salva seu registro no banco de dados."""
+    """Envia a batch file, se ela ainda não estiver no índice de arquivos
+    remotos, e registra o BatchLog na sessão. O commit fica com quem chama."""
     stmt = select(BatchLog).where(BatchLog.ticker == ticker, BatchLog.sub_id == id)
 
-    try:
-        batch_log = session.execute(stmt).scalar_one()
-    except NoResultFound:
-        batch_log = None
-    except MultipleResultsFound:
-        delete_stmt = delete(BatchLog).where(
-            BatchLog.ticker == ticker,
-            BatchLog.sub_id == id,
-            BatchLog.should_retry == True,
-        )
-        session.execute(delete_stmt)
-        batch_log = None
+    batch_log = session.execute(stmt).scalar_one_or_none()
 
     if not batch_log:
         batch_log = BatchLog(
@@ -67,12 +178,11 @@ def get_or_upload_batch_file(
         logger.info(f"{batch_log.sub_id} = {id} = {str(id)}")
         session.add(batch_log)
 
-    if batch_log.file_id:
-        try:
-            stored_file = client.files.retrieve(batch_log.file_id)
-            batch_log.file_id = stored_file.id
-        except NotFoundError:
-            batch_log.file_id = None
+    remoto = get_arquivo_reutilizavel(batch_log, indice, batch_file_name)
+    batch_log.file_id = remoto["id"] if remoto else None
+
+    if batch_log.tokens is None:
+        batch_log.requisicoes, batch_log.tokens = contar_arquivo(batch_file_name)
 
     if not batch_log.file_id:
         try:
@@ -86,93 +196,394 @@ def get_or_upload_batch_file(
         logger.info(
             f"ticker={ticker} msg=arquivo_criado nome={batch_file.filename} file_id={batch_file.id}"
         )
+        sha256 = calcular_sha256(batch_file_name)
+        if batch_log.file_sha256 and batch_log.file_sha256 != sha256:
+            reiniciar_batch_log(batch_log)
+            batch_log.requisicoes, batch_log.tokens = contar_arquivo(batch_file_name)
         batch_log.file_id = batch_file.id
         batch_log.file_name = batch_file.filename
+        batch_log.file_sha256 = sha256
 
-    session.commit()
 
+def reiniciar_batch_log(batch_log: BatchLog):
+    """Esquece o batch de um BatchLog cujo JSONL mudou, para que o novo
+    conteúdo seja solicitado em vez de ficar preso ao batch antigo."""
+    logger.info(
+        f"ticker={batch_log.ticker} sub_id={batch_log.sub_id} msg=arquivo_alterado batch_id={batch_log.batch_id}"
+    )
+    batch_log.batch_id = None
+    batch_log.status = None
+    batch_log.updated_at = None
+    batch_log.output_file_id = None
+    batch_log.output_sha256 = None
+    batch_log.error_file_id = None
+    batch_log.output_ingerido = None
+
+
+class EscritorJsonl:
+    """Escreve as tasks de um ticker em arquivos JSONL, abrindo um novo
+    arquivo sempre que o atual atingiria o limite de requisições, de bytes ou
+    de tokens. Cada arquivo é escrito em um temporário e renomeado ao ser
+    fechado, junto com os tokens de cada requisição (ver `contar_arquivo`).
+    Com `estimar`, os tokens podem ser estimados (ver `tokens.contar_tokens`)
+    e, por isso, não são salvos junto do arquivo."""
+
+    def __init__(
+        self,
+        ticker: str,
+        max_requisicoes: int = MAX_REQUISICOES_POR_ARQUIVO,
+        max_bytes: int = MAX_BYTES_POR_ARQUIVO,
+        max_tokens: int = MAX_TOKENS_POR_ARQUIVO,
+        primeiro_sub_id: int = 1,
+        estimar: bool = False,
+    ):
+        self.ticker = ticker
+        self.estimar = estimar
+        self.primeiro_sub_id = primeiro_sub_id
+        self.max_requisicoes = max_requisicoes
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        self.arquivos: list[tuple[int, str]] = []
+        self.arquivo = None
+        self.requisicoes = 0
+        self.bytes = 0
+        self.tokens: list[int] = []
+        self.total_tokens = 0
+
+    def _abrir(self):
+        self.sub_id = self.primeiro_sub_id + len(self.arquivos)
+        self.nome = get_batch_filename(self.ticker, self.sub_id)
+        self.arquivo = open(f"{self.nome}.tmp", "wb")
+        self.requisicoes = 0
+        self.bytes = 0
+        self.tokens = []
+        self.total_tokens = 0
+
+    def _fechar(self):
+        self.arquivo.close()
+        if not self.estimar:
+            with open(get_tokens_filename(self.nome), "w") as arquivo:
+                arquivo.writelines(f"{tokens}\n" for tokens in self.tokens)
+        os.replace(f"{self.nome}.tmp", self.nome)
+        self.arquivos.append((self.sub_id, self.nome))
+        self.arquivo = None
+        logger.info(
+            f"ticker={self.ticker} msg=jsonl_fechado nome={self.nome} requisicoes={self.requisicoes} tokens={self.total_tokens}"
+        )
+
+    def escrever(self, task: dict, tokens: int | None = None):
+        """Escreve a task; sem `tokens`, eles são contados a partir da task."""
+        linha = (json.dumps(task) + "\n").encode()
+        if tokens is None:
+            tokens = tokens_task(task, self.estimar)
 
-def create_jsonl(ticker, sub_id, batch_tasks: list[dict]):
-    batch_file_name = get_batch_filename(ticker, sub_id)
+        if self.arquivo and (
+            self.requisicoes >= self.max_requisicoes
+            or self.bytes + len(linha) > self.max_bytes
+            or self.total_tokens + tokens > self.max_tokens
+        ):
+            self._fechar()
 
-    if not os.path.isfile(batch_file_name):
-        with open(batch_file_name, "w+") as f:
-            for task in batch_tasks:
-                f.write(json.dumps(task) + "\n")
+        if not self.arquivo:
+            self._abrir()
 
-    return batch_file_name
+        self.arquivo.write(linha)
+        self.requisicoes += 1
+        self.bytes += len(linha)
+        self.tokens.append(tokens)
+        self.total_tokens += tokens
 
+    def __enter__(self):
+        return self
 
-def upload_files_to_openai(client: OpenAI, ticker: str, all_tasks: list[list[dict]]):
-    for id, batch_tasks in enumerate(all_tasks):
-        sub_id = id + 1
+    def __exit__(self, *_):
+        if self.arquivo:
+            self._fechar()
 
-        batch_file_name = create_jsonl(ticker, sub_id, batch_tasks)
-        get_or_upload_batch_file(client, ticker, sub_id, batch_file_name)
+
+def get_tokens_filename(batch_file_name: str) -> str:
+    return f"{batch_file_name}.tokens"
+
+
+def contar_arquivo(batch_file_name: str, estimar: bool = False) -> tuple[int, int]:
+    """Quantidade de requisições e tokens de entrada de um arquivo JSONL. Usa
+    os tokens salvos pelo EscritorJsonl e, sem eles, conta a partir das tasks
+    (estimando com `estimar`, ver `tokens.contar_tokens`)."""
+    tokens_filename = get_tokens_filename(batch_file_name)
+    if os.path.exists(tokens_filename):
+        with open(tokens_filename) as arquivo:
+            tokens = [int(linha) for linha in arquivo]
+        return len(tokens), sum(tokens)
+
+    requisicoes = tokens = 0
+    with open(batch_file_name, "rb") as arquivo:
+        for linha in arquivo:
+            requisicoes += 1
+            tokens += tokens_task(json.loads(linha), estimar)
+    return requisicoes, tokens
+
+
+def upload_files_to_openai(
+    client: OpenAI,
+    session: SessionBanco,
+    indice: IndiceArquivos,
+    ticker: str,
+    arquivos: list[tuple[int, str]],
+):
+    """Envia os arquivos do ticker e salva os BatchLogs em um único commit."""
+    for sub_id, batch_file_name in arquivos:
+        get_or_upload_batch_file(
+            client, session, indice, ticker, sub_id, batch_file_name
+        )
+    session.commit()
 
 
 def get_batch_filename(ticker, sub_id):
     return f"data/batches/batch_tasks_{ticker}_{sub_id}.jsonl"
 
 
-def get_batch_tasks_from_data(
-    client: OpenAI, ticker: str, data: list[dict]
-) -> list[dict] | None:
-    all_tasks = []
-    tasks = []
-    per_batch_limit = 100
-    print("tamanho", len(data))
-
-    for id, item in enumerate(data):
-        aux_id = id + 1
-        if (aux_id % per_batch_limit) == 0:
-            all_tasks.append(tasks)
-            tasks = []
-
-        user_prompt = USER_PROMPT.format(
-            data=item["date"], noticia=item["title"].strip()
+def get_batch_files(ticker) -> list[tuple[int, str]]:
+    """Arquivos JSONL já gerados para o ticker, ordenados pelo sub_id."""
+    prefixo = f"batch_tasks_{ticker}_"
+    arquivos = []
+    for nome in os.listdir("data/batches"):
+        sub_id = nome.removeprefix(prefixo).removesuffix(".jsonl")
+        if nome.startswith(prefixo) and nome.endswith(".jsonl") and sub_id.isdigit():
+            arquivos.append((int(sub_id), f"data/batches/{nome}"))
+    return sorted(arquivos)
+
+
+PREFIXO_CUSTOM_ID = b'{"custom_id": "'
+
+
+def get_hash_ids_arquivos(arquivos: list[tuple[int, str]]) -> set[str]:
+    """hash_ids das notícias que já têm task nos arquivos JSONL. O custom_id
+    é a primeira chave de cada linha, então só o começo dela é lido."""
+    hash_ids = set()
+    for _, batch_file_name in arquivos:
+        with open(batch_file_name, "rb") as arquivo:
+            for linha in arquivo:
+                if linha.startswith(PREFIXO_CUSTOM_ID):
+                    fim = linha.index(b'"', len(PREFIXO_CUSTOM_ID))
+                    custom_id = linha[len(PREFIXO_CUSTOM_ID) : fim].decode()
+                else:
+                    custom_id = json.loads(linha)["custom_id"]
+                hash_ids.add(custom_id.split("-")[-1])
+    return hash_ids
+
+
+def get_pares_arquivos_multi(
+    arquivos: list[tuple[int, str]],
+) -> tuple[set[tuple[str, str]], int]:
+    """Pares (hash_id, ticker) já pedidos nos arquivos multi-ticker, lidos do
+    system prompt de cada task, e o id seguinte ao maior custom_id."""
+    pares = set()
+    proximo_id = 0
+    for _, batch_file_name in arquivos:
+        with open(batch_file_name, "rb") as arquivo:
+            for linha in arquivo:
+                task = json.loads(linha)
+                custom_id = task["custom_id"].removeprefix(f"task_req_{TICKER_MULTI}_")
+                id, _, hash_id = custom_id.partition("-")
+                proximo_id = max(proximo_id, int(id) + 1)
+
+                system_prompt = task["body"]["messages"][0]["content"]
+                for ticker in get_tickers_prompt_multi(system_prompt) or []:
+                    pares.add((hash_id, ticker))
+    return pares, proximo_id
+
+
+def create_task(
+    ticker: str,
+    id: int,
+    hash_id: str,
+    system_prompt,
+    user_prompt,
+    formato=response_format,
+) -> dict:
+    return {
+        "custom_id": f"task_req_{ticker}_{id}-{hash_id}",
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": MODELO,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {
+                    "role": "user",
+                    "content": user_prompt,
+                },
+            ],
+            "response_format": formato,
+        },
+    }
+
+
+def get_batch_tasks(
+    ticker: str, caminho: str, cache: CacheLLM, ignorar: set[str] = frozenset()
+):
+    """Gera as tasks do ticker lendo as notícias um row group por vez. As
+    notícias cujo hash_id está em `ignorar`, ou cuja requisição já tem
+    resposta no cache, são puladas antes de montar os prompts e contar os
+    tokens; o `id` do custom_id continua sendo a posição da notícia no
+    arquivo. Cada task vem com seus tokens de entrada, contados em lote por
+    row group só para as tasks geradas."""
+    system_prompt = get_system_prompt(ticker)
+    noticias = ParquetFile(caminho)
+
+    inicio = 0
+    for row_group in noticias.iter_row_groups(columns=COLUNAS_NOTICIA):
+        novas = ~row_group["hash_id"].isin(ignorar).to_numpy()
+        ids = [inicio + i for i, nova in enumerate(novas) if nova]
+        inicio += len(row_group)
+        row_group = row_group[novas]
+
+        user_prompts = get_user_prompts(row_group["date"], row_group["title"])
+        chaves = [get_chave(MODELO, system_prompt, p) for p in user_prompts]
+        em_cache = set(cache.obter(chaves)["chave"])
+        pendentes = [
+            (id, hash_id, user_prompt)
+            for id, hash_id, user_prompt, chave in zip(
+                ids, row_group["hash_id"], user_prompts, chaves
+            )
+            if chave not in em_cache
+        ]
+        if not pendentes:
+            continue
+
+        tokens = tokens_requisicoes(
+            system_prompt, response_format, [p for _, _, p in pendentes]
+        )
+        for (id, hash_id, user_prompt), tokens_noticia in zip(
+            pendentes, tokens.tolist()
+        ):
+            task = create_task(ticker, id, hash_id, system_prompt, user_prompt)
+            yield task, tokens_noticia
+
+
+def get_batch_tasks_multi(
+    caminhos: dict[str, str],
+    cache: CacheLLM,
+    ignorar: set[tuple[str, str]] = frozenset(),
+    primeiro_id: int = 0,
+):
+    """Gera uma task por notícia (hash_id), pedindo a decisão de todos os
+    tickers cujos arquivos a contêm, que ainda não têm resposta no cache e
+    cujo par (hash_id, ticker) não está em `ignorar`. Os ids começam em
+    `primeiro_id`."""
+    noticias: dict[str, tuple[str, list[str]]] = {}
+
+    for ticker, caminho in caminhos.items():
+        system_prompt = get_system_prompt(ticker)
+        for row_group in ParquetFile(caminho).iter_row_groups(columns=COLUNAS_NOTICIA):
+            user_prompts = get_user_prompts(row_group["date"], row_group["title"])
+            chaves = [get_chave(MODELO, system_prompt, p) for p in user_prompts]
+            em_cache = set(cache.obter(chaves)["chave"])
+
+            for hash_id, user_prompt, chave in zip(
+                row_group["hash_id"], user_prompts, chaves
+            ):
+                if chave not in em_cache and (hash_id, ticker) not in ignorar:
+                    noticias.setdefault(hash_id, (user_prompt, []))[1].append(ticker)
+
+    for id, (hash_id, (user_prompt, tickers)) in enumerate(
+        noticias.items(), start=primeiro_id
+    ):
+        yield create_task(
+            TICKER_MULTI,
+            id,
+            hash_id,
+            get_system_prompt_multi(tickers),
+            user_prompt,
+            response_format_multi,
         )
-        system_prompt = SYSTEM_PROMPT.format(ticker=ticker)
-
-        task = {
-            "custom_id": f"task_req_{ticker}_{id}-{item['hash_id']}",
-            "method": "POST",
-            "url": "/v1/chat/completions",
-            "body": {
-                "model": "gpt-5-nano",
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {
-                        "role": "user",
-                        "content": user_prompt,
-                    },
-                ],
-                "response_format": response_format,
-            },
-        }
-        tasks.append(task)
-
-    if tasks:
-        all_tasks.append(tasks)
-
-    upload_files_to_openai(client, ticker, all_tasks)
-
-
-def create_batch_files(client, arquivos_noticias, uploaded_files):
-    logger.info(f"arquivos_salvos_openai={len(uploaded_files)}")
 
+
+def get_proximo_sub_id(
+    sessao: SessionBanco, ticker: str, arquivos: list[tuple[int, str]]
+) -> int:
+    """Sub_id seguinte ao maior entre os arquivos locais e os BatchLogs do
+    ticker, para que um arquivo novo nunca caia em um BatchLog existente."""
+    sub_ids = sessao.execute(
+        select(BatchLog.sub_id).where(BatchLog.ticker == ticker)
+    ).scalars()
+    maior_log = max(
+        (int(b) for b, _, _ in (s.partition("-r") for s in sub_ids) if b.isdigit()),
+        default=0,
+    )
+    maior_arquivo = max((sub_id for sub_id, _ in arquivos), default=0)
+    return max(maior_log, maior_arquivo) + 1
+
+
+def create_batch_files_for_ticker(ticker: str, caminho: str, sessao: SessionBanco):
+    """Gera os arquivos JSONL do ticker, empacotando as tasks até os limites
+    de requisições e bytes por arquivo. As notícias que já estão em algum
+    arquivo são puladas e as novas vão para arquivos com os sub_ids
+    seguintes, então uma geração interrompida continua de onde parou."""
+    arquivos = get_batch_files(ticker)
+    ignorar = get_hash_ids_arquivos(arquivos)
+
+    with EscritorJsonl(
+        ticker, primeiro_sub_id=get_proximo_sub_id(sessao, ticker, arquivos)
+    ) as escritor:
+        for task, tokens in get_batch_tasks(ticker, caminho, CacheLLM(), ignorar):
+            escritor.escrever(task, tokens)
+
+    logger.info(f"ticker={ticker} msg=jsonl_criados arquivos={len(escritor.arquivos)}")
+    return arquivos + escritor.arquivos
+
+
+def get_batch_tasks_from_data(
+    client: OpenAI, indice: IndiceArquivos, ticker: str, caminho: str
+):
+    """Executada em um processo filho: usa conexões e sessão próprias em vez
+    das herdadas do processo pai."""
+    reiniciar_conexoes()
+    with Session() as sessao:
+        arquivos = create_batch_files_for_ticker(ticker, caminho, sessao)
+        upload_files_to_openai(client, sessao, indice, ticker, arquivos)
+
+
+def create_batch_files_multi(
+    client: OpenAI, indice: IndiceArquivos, arquivos_noticias: list[str]
+):
+    """Gera e envia os arquivos JSONL do modo multi-ticker, com as notícias de
+    todos os tickers agrupadas pelo hash_id."""
+    arquivos = get_batch_files(TICKER_MULTI)
+    ignorar, proximo_id = get_pares_arquivos_multi(arquivos)
+    caminhos = {
+        arquivo.split(".")[0]: f"{CAMINHO_NOTICIAS}{arquivo}"
+        for arquivo in sorted(arquivos_noticias)
+    }
+    with EscritorJsonl(
+        TICKER_MULTI,
+        primeiro_sub_id=get_proximo_sub_id(session, TICKER_MULTI, arquivos),
+    ) as escritor:
+        tasks = get_batch_tasks_multi(caminhos, CacheLLM(), ignorar, proximo_id)
+        for task in tasks:
+            escritor.escrever(task)
+
+    logger.info(
+        f"ticker={TICKER_MULTI} msg=jsonl_criados arquivos={len(escritor.arquivos)}"
+    )
+    arquivos += escritor.arquivos
+
+    upload_files_to_openai(client, session, indice, TICKER_MULTI, arquivos)
+
+
+def create_batch_files(
+    client: OpenAI, indice: IndiceArquivos, arquivos_noticias: list[str]
+):
     processos = []
     quantidade_noticias = len(arquivos_noticias)
 
     for pos, arquivo in enumerate(arquivos_noticias):
         ticker = arquivo.split(".")[0]
         caminho = f"{CAMINHO_NOTICIAS}{ticker}.parquet"
-        data = pd.read_parquet(caminho).to_dict("records")
-        print(len(data))
 
         p = Process(
             target=get_batch_tasks_from_data,
-            args=(client, ticker, data),
+            args=(client, indice, ticker, caminho),
         )
         p.start()
 
@@ -183,9 +594,10 @@ def create_batch_files(client, arquivos_noticias, uploaded_files):
             processos = []
 
 
-def send_request(client, log: BatchLog):
+async def send_request(cliente: ClienteBatch, log: BatchLog):
     try:
-        batch_job = client.batches.create(
+        batch_job = await cliente.chamar(
+            cliente.client.batches.create,
             input_file_id=log.file_id,
             endpoint="/v1/chat/completions",
             completion_window="24h",
@@ -194,7 +606,7 @@ def send_request(client, log: BatchLog):
             logger.info(f"ticker={log.ticker} status=job_failed")  # Olhar no dashboard
             return None
 
-        return batch_job.id
+        return batch_job
     except Exception as err:
         logger.info(
             f"ticker={log.ticker} status=erro_solicitar_processamento erro={err}"
@@ -202,137 +614,286 @@ def send_request(client, log: BatchLog):
         return None
 
 
-def solicitar_para_log(client: OpenAI, log: BatchLog):
-    batch_id = send_request(client, log)
-    log.batch_id = batch_id
-    session.commit()
+async def solicitar_para_log(
+    cliente: ClienteBatch, escritor: EscritorBanco, log: BatchLog
+):
+    batch_job = await send_request(cliente, log)
+    if not batch_job:
+        escritor.atualizar(log, batch_id=None, status=None, updated_at=datetime.now())
+        return
+
+    escritor.atualizar(
+        log,
+        batch_id=batch_job.id,
+        status=batch_job.status,
+        updated_at=datetime.now(),
+    )
     logger.info(
-        f"ticker={log.ticker} status=solicitacao_sucesso batch_id={log.batch_id}"
+        f"ticker={log.ticker} status=solicitacao_sucesso batch_id={batch_job.id}"
     )
 
 
-def solicitar_processamento(client: OpenAI, log: BatchLog):
-    if not log.batch_id:
-        solicitar_para_log(client, log)
-        return
-
+async def atualizar_status(
+    cliente: ClienteBatch, escritor: EscritorBanco, log: BatchLog
+):
+    """Consulta um batch em andamento e salva o novo status no BatchLog."""
     try:
-        batch = client.batches.retrieve(log.batch_id)
+        batch = await cliente.chamar(cliente.client.batches.retrieve, log.batch_id)
     except BadRequestError as err:
-        logger.error(f"ticker={log.ticker} status=erro_ao_solicitar erro={err}")
+        logger.error(f"ticker={log.ticker} status=erro_ao_consultar erro={err}")
         return
 
-    if batch.errors:
-        erros = batch.errors.data or []
-        for erro in erros:
-            if erro.code == "invalid_type":
-                logger.info(f"ticker={log.ticker} erro=tipo_invalido status=pulando")
-
-                log.should_retry = False
-                log.batch_id = f"{log.batch_id}_invalid"
-                session.commit()
-                return
-
-    if batch.status == "completed":
-        logger.info(f"ticker={log.ticker} status=finalizado")
-        log.should_retry = False
-        session.commit()
-        return
-
-    if log.should_retry:
-        solicitar_para_log(client, log)
-
+    valores = {"status": batch.status, "updated_at": datetime.now()}
 
-def deve_solicitar(client: OpenAI):
-    batches = []
-    cursor = None
-    while True:
-        response = client.batches.list(limit=100, after=cursor)
-
-        for batch in response.data:
-            batches.append(batch)
-
-        if not response.has_more:
-            break
-
-        cursor = response.data[-1].id
-
-    em_andamento = len(
-        [
-            b
-            for b in batches
-            if b.status
-            in [
-                "validating",
-                "in_progress",
-                "finalizing",
-                "cancelling",
-            ]
-        ]
-    )
-    logger.info(f"== {em_andamento} processos em andamento ==")
-    if em_andamento >= MINIMUM_BATCHES:
-        return False
-    return True
+    erros = batch.errors.data if batch.errors else None
+    if any(erro.code == "invalid_type" for erro in erros or []):
+        logger.info(f"ticker={log.ticker} erro=tipo_invalido status=pulando")
+        valores.update(should_retry=False, batch_id=f"{log.batch_id}_invalid")
+    elif batch.status == "completed":
+        logger.info(
+            f"ticker={log.ticker} status=finalizado error_file_id={batch.error_file_id}"
+        )
+        valores.update(should_retry=False, error_file_id=batch.error_file_id)
 
+    escritor.atualizar(log, **valores)
 
-def processar_acoes():
-    logger.info("Iniciando job")
-    client = OpenAI(api_key=config("OPENAI_API_KEY"))
 
-    arquivos_noticias = os.listdir(CAMINHO_NOTICIAS)
-    uploaded_files = client.files.list().data
-    uploaded_files = {f.filename: f.id for f in uploaded_files}
+def get_logs_em_andamento():
+    """BatchLogs cujo batch ainda não chegou a um status terminal. Registros
+    sem status (anteriores à coluna) são consultados uma única vez."""
+    stmt = select(BatchLog).where(
+        BatchLog.batch_id.is_not(null()),
+        ~(BatchLog.batch_id.endswith("invalid")),
+        BatchLog.status.is_(null()) | BatchLog.status.in_(STATUS_EM_ANDAMENTO),
+    )
+    return session.execute(stmt).scalars().all()
 
-    create_batch_files(client, arquivos_noticias, uploaded_files)
 
-    if not deve_solicitar(client):
-        return
+def get_logs_para_solicitar():
+    """BatchLogs ainda não enviados ou cujo batch terminou sem sucesso. Os que
+    não têm arquivo (o envio falhou) ficam de fora até `processar_acoes`
+    enviar o arquivo de novo."""
+    stmt = (
+        select(BatchLog)
+        .where(
+            BatchLog.file_id.is_not(null()),
+            (
+                (BatchLog.should_retry == True)
+                & ~(BatchLog.batch_id.endswith("invalid"))
+                & BatchLog.status.in_(("failed", "expired", "cancelled"))
+            )
+            | (BatchLog.batch_id.is_(null())),
+        )
+        .order_by(BatchLog.id.asc())
+    )
+    return session.execute(stmt).scalars().all()
 
-    logger.info("== Solicitando ==")
 
+def get_logs_com_falhas():
+    """BatchLogs completos com requisições que falharam e que ainda não têm
+    um batch de nova tentativa."""
+    retentativa = aliased(BatchLog)
     stmt = (
         select(BatchLog)
         .where(
-            ((BatchLog.should_retry == True) & ~(BatchLog.batch_id.endswith("invalid")))
-            | (BatchLog.batch_id.is_(null()))
+            BatchLog.status == "completed",
+            BatchLog.error_file_id.is_not(null()),
+            ~(BatchLog.error_file_id.endswith("ignorado")),
+            ~select(retentativa.id)
+            .where(retentativa.origem_id == BatchLog.id)
+            .exists(),
         )
         .order_by(BatchLog.id.asc())
     )
-    batch_logs = session.execute(stmt).scalars().all()
+    return session.execute(stmt).scalars().all()
 
-    processos = []
-    quantidade_logs = len(batch_logs)
 
-    for pos, log in enumerate(batch_logs):
-        if pos > MAX_BATCHES:
-            break
+def get_sub_id_retentativa(sub_id: str) -> str | None:
+    """Sub_id do batch de nova tentativa (`1` -> `1-r1` -> `1-r2`), ou None
+    quando o limite de tentativas foi atingido."""
+    base, _, tentativa = sub_id.partition("-r")
+    tentativa = int(tentativa or 0) + 1
+    if tentativa > MAX_RETENTATIVAS_PARCIAIS:
+        return None
+    return f"{base}-r{tentativa}"
 
-        p = Process(
-            target=solicitar_processamento,
-            args=(client, log),
+
+async def criar_retentativa(cliente: ClienteBatch, log: BatchLog) -> BatchLog | None:
+    """Gera e envia um arquivo só com as requisições que estão no arquivo de
+    erros do batch, a partir do JSONL original. Sem o JSONL ou passado o
+    limite de tentativas, o arquivo de erros é marcado como ignorado."""
+    sub_id = get_sub_id_retentativa(log.sub_id)
+    entrada = get_batch_filename(log.ticker, log.sub_id)
+    if sub_id is None or not os.path.exists(entrada):
+        logger.info(
+            f"ticker={log.ticker} sub_id={log.sub_id} status=sem_retentativa arquivo={entrada}"
         )
-        p.start()
+        log.error_file_id = f"{log.error_file_id}_ignorado"
+        return None
+
+    erros = await cliente.chamar(cliente.client.files.content, log.error_file_id)
+    falhas = {
+        json.loads(linha)["custom_id"] for linha in erros.text.splitlines() if linha
+    }
+
+    nome = get_batch_filename(log.ticker, sub_id)
+    with open(entrada, "rb") as origem, open(f"{nome}.tmp", "wb") as destino:
+        for linha in origem:
+            if json.loads(linha)["custom_id"] in falhas:
+                destino.write(linha)
+    os.replace(f"{nome}.tmp", nome)
+
+    with open(nome, "rb") as arquivo:
+        enviado = await cliente.chamar(
+            cliente.client.files.create, file=arquivo, purpose="batch"
+        )
+
+    requisicoes, tokens = contar_arquivo(nome)
+    logger.info(
+        f"ticker={log.ticker} sub_id={sub_id} status=retentativa_criada requisicoes={requisicoes} origem={log.sub_id}"
+    )
+    return BatchLog(
+        ticker=log.ticker,
+        sub_id=sub_id,
+        file_name=enviado.filename,
+        file_id=enviado.id,
+        should_retry=True,
+        requisicoes=requisicoes,
+        tokens=tokens,
+        origem_id=log.id,
+    )
 
-        processos.append(p)
-        if (
-            len(processos) == NUM_WORKERS
-            or pos == quantidade_logs - 1
-            or pos == MAX_BATCHES - 1
-        ):
-            for p in processos:
-                p.join()
-            processos = []
 
+async def criar_retentativas(cliente: ClienteBatch):
+    """Cria os batches de nova tentativa dos logs com falhas parciais. Eles
+    entram na fila como pendentes, sem reenviar o que já teve resposta."""
+    logs = get_logs_com_falhas()
+    resultados = await asyncio.gather(
+        *(criar_retentativa(cliente, log) for log in logs), return_exceptions=True
+    )
+
+    for log, resultado in zip(logs, resultados):
+        if isinstance(resultado, Exception):
+            logger.error(
+                f"ticker={log.ticker} status=erro_ao_criar_retentativa erro={resultado}"
+            )
+        elif resultado is not None:
+            session.add(resultado)
+    session.commit()
+
+
+def get_uso_em_andamento() -> tuple[int, int, int]:
+    """Quantidade de batches, tokens e requisições em andamento."""
+    stmt = select(
+        func.count(BatchLog.id),
+        func.coalesce(func.sum(BatchLog.tokens), 0),
+        func.coalesce(func.sum(BatchLog.requisicoes), 0),
+    ).where(BatchLog.status.in_(STATUS_EM_ANDAMENTO))
+    return session.execute(stmt).one()
+
+
+def selecionar_para_orcamento(logs: list[BatchLog]) -> list[BatchLog]:
+    """Seleciona, em ordem, os logs que cabem no orçamento ainda livre. Com a
+    fila vazia, o primeiro é sempre aceito, mesmo que sozinho passe do limite."""
+    em_andamento, tokens, requisicoes = get_uso_em_andamento()
+    logger.info(
+        f"em_andamento={em_andamento} tokens={tokens}/{ORCAMENTO_TOKENS} requisicoes={requisicoes}/{ORCAMENTO_REQUISICOES}"
+    )
+
+    selecionados = []
+    for log in logs:
+        cabe = (
+            tokens + (log.tokens or 0) <= ORCAMENTO_TOKENS
+            and requisicoes + (log.requisicoes or 0) <= ORCAMENTO_REQUISICOES
+        )
+        if not cabe and (em_andamento or selecionados):
+            continue
+
+        selecionados.append(log)
+        tokens += log.tokens or 0
+        requisicoes += log.requisicoes or 0
+
+    return selecionados
+
+
+async def executar(
+    cliente: ClienteBatch, corrotina, logs: list[BatchLog], status_erro: str
+):
+    """Executa `corrotina(cliente, escritor, log)` para cada log, em paralelo."""
+    async with EscritorBanco(session) as escritor:
+        resultados = await asyncio.gather(
+            *(corrotina(cliente, escritor, log) for log in logs),
+            return_exceptions=True,
+        )
+
+    for log, resultado in zip(logs, resultados):
+        if isinstance(resultado, Exception):
+            logger.error(f"ticker={log.ticker} status={status_erro} erro={resultado}")
+
+
+async def solicitar_batches(cliente: ClienteBatch) -> tuple[bool, bool]:
+    """Atualiza os batches em andamento e envia os pendentes que cabem no
+    orçamento. Retorna se algum batch terminou e se algum foi enviado."""
+
+    # Só os batches em andamento são consultados na API; o restante do
+    # controle é feito pelo status salvo no banco.
+    em_andamento = get_logs_em_andamento()
+    logger.info(f"== Consultando {len(em_andamento)} batches ==")
+    await executar(cliente, atualizar_status, em_andamento, "erro_ao_consultar")
+    terminou = any(log.status in STATUS_TERMINAIS for log in em_andamento)
+    await criar_retentativas(cliente)
+
+    pendentes = get_logs_para_solicitar()
+    selecionados = selecionar_para_orcamento(pendentes)
+    logger.info(f"== Solicitando {len(selecionados)} de {len(pendentes)} ==")
+    await executar(cliente, solicitar_para_log, selecionados, "erro_ao_solicitar")
+
+    return terminou, bool(selecionados)
+
+
+async def escalonar():
+    """Mantém a fila de batches cheia: a cada consulta, os batches que
+    terminaram liberam orçamento para os pendentes na mesma rodada. O
+    intervalo encurta enquanto há mudanças e cresce quando a fila está parada."""
+
+    cliente = ClienteBatch()
+
+    intervalo = INTERVALO_MINIMO
+    while True:
+        # Os arquivos são (re)gerados e enviados quando não há mais o que solicitar.
+        if not get_logs_para_solicitar():
+            processar_acoes()
+
+        terminou, enviou = await solicitar_batches(cliente)
+        if terminou or enviou:
+            intervalo = INTERVALO_MINIMO
+        else:
+            intervalo = min(2 * intervalo, INTERVALO_MAXIMO)
+
+        logger.info(f"== Próxima consulta em {intervalo}s ==")
+        await asyncio.sleep(intervalo)
+
+
+def processar_acoes():
+    logger.info("Iniciando job")
+    client = OpenAI(api_key=config("OPENAI_API_KEY"))
+
+    arquivos_noticias = os.listdir(CAMINHO_NOTICIAS)
+    # Uma listagem por rodada decide, para todos os arquivos, entre reaproveitar
+    # e enviar, sem consultar a API arquivo a arquivo.
+    indice = get_indice_arquivos(client)
 
-scheduler = BlockingScheduler()
-scheduler.add_job(processar_acoes, "date", run_date=datetime.now())
-scheduler.add_job(processar_acoes, "interval", minutes=5)
+    if MODO_MULTI_TICKER:
+        create_batch_files_multi(client, indice, arquivos_noticias)
+    else:
+        create_batch_files(client, indice, arquivos_noticias)
+    session.expire_all()
 
 
 def main():
-    logger.info("Iniciando scheduler")
-    scheduler.start()
+    criar_tabelas()
+    logger.info("Iniciando escalonador")
+    asyncio.run(escalonar())
 
 
 if __name__ == "__main__":
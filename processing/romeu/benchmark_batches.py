@@ -0,0 +1,170 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from logs import get_logger
+from openai_falso import EstadoFalso, ServidorFalso
+
+logger = get_logger()
+
+TICKER = "bench3"
+
+
+def configurar_ambiente(diretorio: str, url: str, args):
+    """Aponta banco, clientes e orçamento para o ambiente do benchmark. Precisa
+    rodar antes de importar `database`, `batch_processing` e `pipeline`."""
+    os.environ["SQLITE_URL"] = f"sqlite:///{diretorio}/benchmark.db"
+    os.environ["OPENAI_BASE_URL"] = url
+    os.environ["OPENAI_API_KEY"] = "chave-falsa"
+    os.environ["BATCH_ORCAMENTO_TOKENS"] = str(args.orcamento_tokens)
+    os.environ["BATCH_ORCAMENTO_REQUISICOES"] = str(args.orcamento_requisicoes)
+    os.environ["BATCH_CONCORRENCIA"] = str(args.concorrencia)
+
+    os.makedirs(diretorio, exist_ok=True)
+    os.chdir(diretorio)
+    os.makedirs("data/batches", exist_ok=True)
+    os.makedirs("data/output3", exist_ok=True)
+
+
+def gerar_arquivos(quantidade: int, requisicoes: int) -> list[tuple[int, str]]:
+    from batch_processing import EscritorJsonl, create_task
+    from cache_llm import get_system_prompt, get_user_prompt
+
+    # Os tokens são estimados se o encoding do tiktoken não estiver disponível:
+    # o benchmark não depende de rede.
+    system_prompt = get_system_prompt(TICKER)
+    with EscritorJsonl(TICKER, max_requisicoes=requisicoes, estimar=True) as escritor:
+        for id in range(quantidade * requisicoes):
+            user_prompt = get_user_prompt("2024-01-02", f"Notícia sintética {id}")
+            escritor.escrever(
+                create_task(TICKER, id, f"{id:08x}", system_prompt, user_prompt)
+            )
+    return escritor.arquivos
+
+
+async def enviar_arquivo(cliente, sub_id: int, nome: str):
+    from batch_processing import contar_arquivo
+    from database import BatchLog
+
+    with open(nome, "rb") as arquivo:
+        enviado = await cliente.chamar(
+            cliente.client.files.create, file=arquivo, purpose="batch"
+        )
+
+    requisicoes, tokens = contar_arquivo(nome, estimar=True)
+    return BatchLog(
+        ticker=TICKER,
+        sub_id=str(sub_id),
+        file_name=enviado.filename,
+        file_id=enviado.id,
+        should_retry=True,
+        requisicoes=requisicoes,
+        tokens=tokens,
+    )
+
+
+async def enviar_arquivos(cliente, arquivos: list[tuple[int, str]]):
+    from batch_processing import session
+
+    logs = await asyncio.gather(
+        *(enviar_arquivo(cliente, sub_id, nome) for sub_id, nome in arquivos)
+    )
+    session.add_all(logs)
+    session.commit()
+
+
+async def processar(cliente, intervalo: float) -> int:
+    """Roda as rodadas de consulta e envio até não restar batch pendente nem em
+    andamento. Retorna a quantidade de rodadas."""
+    from batch_processing import (
+        get_logs_em_andamento,
+        get_logs_para_solicitar,
+        solicitar_batches,
+    )
+
+    rodadas = 0
+    while get_logs_para_solicitar() or get_logs_em_andamento():
+        await solicitar_batches(cliente)
+        rodadas += 1
+        await asyncio.sleep(intervalo)
+    return rodadas
+
+
+async def executar_benchmark(args) -> dict[str, float]:
+    from cliente_batch import ClienteBatch
+    from database import criar_tabelas
+    from pipeline import Pipeline
+
+    criar_tabelas()
+    cliente = ClienteBatch()
+    tempos = {}
+
+    inicio = time.perf_counter()
+    arquivos = gerar_arquivos(args.batches, args.requisicoes)
+    tempos["gerar"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    await enviar_arquivos(cliente, arquivos)
+    tempos["enviar"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    rodadas = await processar(cliente, args.intervalo)
+    tempos["processar"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    await Pipeline()._collect()
+    tempos["coletar"] = time.perf_counter() - inicio
+
+    logger.info(f"rodadas={rodadas}")
+    return tempos
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--batches", dest="batches", type=int, default=1000)
+parser.add_argument("--requisicoes", dest="requisicoes", type=int, default=10)
+parser.add_argument("--duracao", dest="duracao", type=float, default=2.0)
+parser.add_argument("--latencia", dest="latencia", type=float, default=0.0)
+parser.add_argument("--intervalo", dest="intervalo", type=float, default=0.5)
+parser.add_argument("--concorrencia", dest="concorrencia", type=int, default=16)
+parser.add_argument("--taxa-429", dest="taxa_429", type=float, default=0.0)
+parser.add_argument("--taxa-invalido", dest="taxa_invalido", type=float, default=0.0)
+parser.add_argument("--taxa-expirado", dest="taxa_expirado", type=float, default=0.0)
+parser.add_argument(
+    "--taxa-falha-linha", dest="taxa_falha_linha", type=float, default=0.0
+)
+parser.add_argument(
+    "--orcamento-tokens", dest="orcamento_tokens", type=int, default=2_000_000
+)
+parser.add_argument(
+    "--orcamento-requisicoes", dest="orcamento_requisicoes", type=int, default=500_000
+)
+parser.add_argument("--diretorio", dest="diretorio", type=str)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    diretorio = args.diretorio or tempfile.mkdtemp(prefix="benchmark-batches-")
+
+    estado = EstadoFalso(
+        duracao=args.duracao,
+        taxa_429=args.taxa_429,
+        taxa_invalido=args.taxa_invalido,
+        taxa_expirado=args.taxa_expirado,
+        taxa_falha_linha=args.taxa_falha_linha,
+        semente=0,
+    )
+    with ServidorFalso(latencia=args.latencia, estado=estado) as servidor:
+        configurar_ambiente(diretorio, servidor.url, args)
+        tempos = asyncio.run(executar_benchmark(args))
+
+    total = args.batches * args.requisicoes
+    for etapa, segundos in tempos.items():
+        logger.info(f"etapa={etapa} segundos={segundos:.2f}")
+
+    ciclo = tempos["enviar"] + tempos["processar"] + tempos["coletar"]
+    logger.info(
+        f"batches={args.batches} requisicoes={total} segundos={ciclo:.2f} "
+        f"batches_por_segundo={args.batches / ciclo:.1f} "
+        f"requisicoes_por_segundo={total / ciclo:.1f} diretorio={diretorio}"
+    )
@@ -1,46 +1,167 @@
-import glob
+import asyncio
+import hashlib
 import json
-import math
+from multiprocessing import Pool
+import os
 import pandas as pd
-import matplotlib.pyplot as plt
 
-from matplotlib.gridspec import GridSpec
-
-from typing import TypedDict
-from config import CAMINHO_NOTICIAS, GRAPH_PATH, OUTPUT_PATH, STRATEGY_PATH
+from config import CAMINHO_NOTICIAS, OUTPUT_PATH, STRATEGY_PATH
 from logs import get_logger
 
 from sqlalchemy import select
 from sqlalchemy.orm import sessionmaker
-from database import sqlite_engine, BatchLog
+from database import sqlite_engine, BatchLog, criar_tabelas
+from cliente_batch import ClienteBatch, EscritorBanco
+from cache_llm import CacheLLM, get_chave, get_chaves_noticias
+from batch_processing import calcular_sha256, get_batch_filename
+from resultados import ResultadosBatch
 from logs import get_logger
-from openai import OpenAI
-from decouple import config
-from multiprocessing import Process
-from config import OUTPUT_PATH
+from config import OUTPUT_PATH, TICKER_MULTI
+from backtesting import backtest
+from graficos import renderizar_graficos
 
 Session = sessionmaker(bind=sqlite_engine)
 session = Session()
 
 logger = get_logger()
 
-NUM_WORKERS = 16
+NUM_WORKERS = 8
+
+COLUNAS_OUTPUT = ["custom_id", "hash_id", "ticker", "decisao", "motivo", "chave"]
 
 
-class Position:
-    LONG = "LONG"
-    SHORT = "SHORT"
-    UNKNOWN = "UNKNOWN"
+def ler_chaves(entrada: str, sha256: str | None = None) -> dict[str, str]:
+    """Chave do CacheLLM de cada custom_id do JSONL de entrada, calculada com o
+    modelo e os prompts que foram enviados. Se o arquivo não é mais o que foi
+    enviado (sha256 diferente), nenhuma chave é devolvida."""
+    if sha256 and calcular_sha256(entrada) != sha256:
+        logger.warning(f"arquivo={entrada} status=entrada_alterada")
+        return {}
 
+    chaves = {}
+    with open(entrada, "rb") as jsonl:
+        for linha in jsonl:
+            task = json.loads(linha)
+            body = task["body"]
+            mensagens = {m["role"]: m["content"] for m in body["messages"]}
+            chaves[task["custom_id"]] = get_chave(
+                body["model"], mensagens["system"], mensagens["user"]
+            )
+    return chaves
+
+
+def ler_output(
+    caminho: str, entrada: str | None = None, sha256: str | None = None
+) -> tuple[dict[str, list], int]:
+    """Lê um arquivo de saída do batch linha a linha, direto em colunas. Nas
+    respostas multi-ticker, cada decisão vira uma linha com seu ticker; nas
+    demais, o ticker fica vazio. Com o JSONL de `entrada`, cada resposta vem
+    com a chave da requisição enviada (ver `ler_chaves`). Retorna as colunas e
+    a quantidade de linhas malformadas, que são puladas."""
+    colunas = {coluna: [] for coluna in COLUNAS_OUTPUT}
+    malformadas = 0
+    chaves = ler_chaves(entrada, sha256) if entrada else {}
+
+    with open(caminho, "rb") as jsonl:
+        for linha in jsonl:
+            try:
+                item = json.loads(linha)
+                custom_id = item["custom_id"]
+                conteudo = json.loads(
+                    item["response"]["body"]["choices"][0]["message"]["content"]
+                )
+                decisoes = conteudo.get("decisoes") or [conteudo]
+                linhas = [
+                    (d.get("ticker"), d["decisao"], d["motivo"]) for d in decisoes
+                ]
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                malformadas += 1
+                continue
+
+            hash_id = custom_id.split("-")[-1]
+            for ticker, decisao, motivo in linhas:
+                colunas["custom_id"].append(custom_id)
+                colunas["hash_id"].append(hash_id)
+                colunas["ticker"].append(ticker.lower() if ticker else None)
+                colunas["decisao"].append(decisao)
+                colunas["motivo"].append(motivo)
+                colunas["chave"].append(chaves.get(custom_id))
+
+    return colunas, malformadas
+
+
+def ler_outputs(
+    output_files: list[str],
+    num_workers: int = NUM_WORKERS,
+    entradas: list[tuple[str | None, str | None]] | None = None,
+) -> list[dict[str, list]]:
+    """Lê os arquivos de saída em um pool de processos, na ordem recebida.
+    `entradas` traz, para cada saída, o JSONL de entrada e seu sha256."""
+    if not output_files:
+        return []
+
+    entradas = entradas or [(None, None)] * len(output_files)
+    with Pool(min(num_workers, len(output_files))) as pool:
+        lidos = pool.starmap(
+            ler_output,
+            [(file, *entrada) for file, entrada in zip(output_files, entradas)],
+        )
 
-class Entry(TypedDict):
-    open: float
-    close: float
-    posicao: str
+    for file, (_, malformadas) in zip(output_files, lidos):
+        if malformadas:
+            logger.warning(f"arquivo={file} linhas_malformadas={malformadas}")
+    logger.info(
+        f"arquivos={len(output_files)} linhas_malformadas={sum(m for _, m in lidos)}"
+    )
+    return [colunas for colunas, _ in lidos]
 
 
 class Pipeline:
-    def _get_output_file(self, client: OpenAI, log: BatchLog):
+    async def _baixar(
+        self, cliente: ClienteBatch, output_file_id: str, output_filename: str
+    ) -> str:
+        """Baixa o arquivo em partes para um temporário, renomeado só ao fim
+        do download. Retorna o sha256 do conteúdo."""
+        temporario = f"{output_filename}.tmp"
+
+        async def baixar():
+            sha256 = hashlib.sha256()
+            async with cliente.client.with_streaming_response.files.content(
+                output_file_id
+            ) as resposta:
+                with open(temporario, "wb") as arquivo:
+                    async for parte in resposta.iter_bytes():
+                        sha256.update(parte)
+                        arquivo.write(parte)
+            return sha256.hexdigest()
+
+        try:
+            sha256 = await cliente.chamar(baixar)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+        os.replace(temporario, output_filename)
+        return sha256
+
+    async def _get_output_file(
+        self, cliente: ClienteBatch, escritor: EscritorBanco, log: BatchLog
+    ):
+        """Baixa a saída do batch do log. Um arquivo já baixado só é mantido se
+        o seu sha256 confere com o salvo no download; senão, é baixado de novo."""
+        output_filename = self.get_output_filename(log)
+        if log.output_file_id and os.path.exists(output_filename):
+            sha256 = await asyncio.to_thread(calcular_sha256, output_filename)
+            if sha256 == log.output_sha256:
+                logger.info(
+                    f"ticker={log.ticker} sub_id={log.sub_id} status=ja_baixado path={output_filename}"
+                )
+                return
+            logger.warning(
+                f"ticker={log.ticker} sub_id={log.sub_id} status=sha256_divergente path={output_filename}"
+            )
+
         if not log.batch_id:
             logger.info(
                 f"ticker={log.ticker} sub_id={log.sub_id} status=batch_id_indisponivel"
@@ -48,7 +169,7 @@ class Pipeline:
             return
 
         try:
-            batch = client.batches.retrieve(log.batch_id)
+            batch = await cliente.chamar(cliente.client.batches.retrieve, log.batch_id)
         except Exception:
             logger.info(
                 f"ticker={log.ticker} sub_id={log.sub_id} status=erro_ao_consultar"
@@ -61,75 +182,124 @@ class Pipeline:
             )
             return
 
-        output_content = client.files.content(batch.output_file_id).content
-
-        output_filename = f"{OUTPUT_PATH}/output_{log.ticker}_{log.sub_id}.jsonl"
-        with open(output_filename, "wb") as f:
-            f.write(output_content)
+        sha256 = await self._baixar(cliente, batch.output_file_id, output_filename)
+        escritor.atualizar(
+            log,
+            output_file_id=batch.output_file_id,
+            output_sha256=sha256,
+            output_ingerido=False,
+        )
 
         logger.info(
-            f"ticker={log.ticker} sub_id={log.sub_id} status=sucesso path={output_filename}"
+            f"ticker={log.ticker} sub_id={log.sub_id} status=sucesso path={output_filename} sha256={sha256}"
         )
 
-    def collect(self):
-        client = OpenAI(api_key=config("OPENAI_API_KEY"))
-        stmt = select(BatchLog).where(~(BatchLog.batch_id.endswith("invalid")))
+    async def _collect(self):
+        cliente = ClienteBatch()
+        stmt = select(BatchLog).where(
+            ~(BatchLog.batch_id.endswith("invalid")),
+            BatchLog.status.is_(None) | (BatchLog.status == "completed"),
+        )
         result = session.execute(stmt)
         batch_logs = result.scalars().all()
 
-        quantidade_batches = len(batch_logs)
-        processos = []
-        for pos, log in enumerate(batch_logs):
-            p = Process(target=self._get_output_file, args=(client, log))
-            p.start()
-
-            processos.append(p)
-            if len(processos) == NUM_WORKERS or pos == quantidade_batches - 1:
-                for p in processos:
-                    p.join()
-                processos = []
+        async with EscritorBanco(session) as escritor:
+            resultados = await asyncio.gather(
+                *(self._get_output_file(cliente, escritor, log) for log in batch_logs),
+                return_exceptions=True,
+            )
+        for log, resultado in zip(batch_logs, resultados):
+            if isinstance(resultado, Exception):
+                logger.error(
+                    f"ticker={log.ticker} sub_id={log.sub_id} status=erro_ao_baixar erro={resultado}"
+                )
 
+    def collect(self):
+        criar_tabelas()
+        asyncio.run(self._collect())
+        self.ingerir()
         logger.info("Processo finalizado")
 
-    def get_output_path(self, ticker: str):
-        return f"{OUTPUT_PATH}/output_{ticker}*"
-
-    def sort_method(self, file: str):
-        file_name = file.split(".")[0]
-        file_name = file_name.split("_")[-1]
-        return int(file_name)
-
-    def read_output(self, output_files: list[str]):
-        output_files = sorted(output_files, key=self.sort_method)
-        print(len(output_files))
-
-        responses = []
-
-        for file in output_files:
-            print(f"lendo {file}")
-            with open(file, "rb") as jsonl:
-                data = list(jsonl)
-                for item in data:
-                    item_data = json.loads(item)
-                    response = json.loads(
-                        item_data["response"]["body"]["choices"][0]["message"][
-                            "content"
-                        ]
-                    )
-                    hash_id = item_data["custom_id"].split("-")[-1]
-                    response["hash_id"] = hash_id
-                    responses.append(response)
-
-        return responses
+    def get_output_filename(self, log: BatchLog):
+        return f"{OUTPUT_PATH}/output_{log.ticker}_{log.sub_id}.jsonl"
+
+    def ingerir(self, num_workers: int = NUM_WORKERS):
+        """Carrega na tabela resultado_batch as saídas baixadas que ainda não
+        foram carregadas, na ordem dos BatchLogs, e as marca como carregadas.
+        Nas saídas por ticker, o ticker vem do BatchLog e a chave do cache, do
+        JSONL enviado; nas multi-ticker, o ticker vem de cada decisão e a
+        chave fica vazia, pois a requisição não corresponde a nenhuma chave
+        de um único ticker."""
+        stmt = (
+            select(BatchLog)
+            .where(BatchLog.output_ingerido.is_not(True))
+            .order_by(BatchLog.id.asc())
+        )
+        logs = [
+            log
+            for log in session.execute(stmt).scalars()
+            if os.path.exists(self.get_output_filename(log))
+        ]
+        if not logs:
+            return
+
+        output_files = [self.get_output_filename(log) for log in logs]
+        entradas = [self.get_entrada(log) for log in logs]
+        resultados = []
+        lidos = ler_outputs(output_files, num_workers, entradas)
+        for log, colunas in zip(logs, lidos):
+            resultado = pd.DataFrame(colunas, columns=COLUNAS_OUTPUT)
+            resultado["ticker"] = resultado["ticker"].fillna(log.ticker.lower())
+            resultado["batch_id"] = log.batch_id
+            resultados.append(resultado)
+
+        resultados = pd.concat(resultados, ignore_index=True)
+        ResultadosBatch().salvar(resultados)
+
+        for log in logs:
+            log.output_ingerido = True
+        session.commit()
+        logger.info(f"arquivos={len(logs)} resultados_ingeridos={len(resultados)}")
+
+    def get_entrada(self, log: BatchLog) -> tuple[str | None, str | None]:
+        """JSONL de entrada do log e o sha256 do envio, quando ainda existe
+        localmente e o log é de um único ticker."""
+        entrada = get_batch_filename(log.ticker, log.sub_id)
+        if log.ticker == TICKER_MULTI or not os.path.exists(entrada):
+            return None, None
+        return entrada, log.file_sha256
 
     def reassamble_news(self, news_df: pd.DataFrame, ticker: str):
-        output_files = glob.glob(self.get_output_path(ticker))
-        output = self.read_output(output_files)
-        logger.info(f"ticker={ticker} respostas={len(output)}")
+        criar_tabelas()
+        self.ingerir()
+        output_df = ResultadosBatch().obter(ticker)
+        logger.info(f"ticker={ticker} respostas={len(output_df)}")
 
-        output_df = pd.DataFrame(output)
         news_df["date"].dt.tz_localize("America/Sao_Paulo")
-        df = news_df.merge(output_df, on="hash_id")
+
+        # As respostas novas vão para o cache sob a chave da requisição que as
+        # gerou, e as notícias são preenchidas pela chave da requisição atual:
+        # respostas de outro prompt, modelo ou corte do texto não são usadas.
+        news_df["chave"] = get_chaves_noticias(ticker, news_df)
+        cache = CacheLLM()
+        cache.salvar(output_df.dropna(subset=["chave"]))
+        df = news_df.merge(
+            cache.obter(news_df["chave"]), on="chave", how="left", indicator=True
+        )
+
+        # As respostas multi-ticker não têm chave de um único ticker e
+        # completam as notícias que ficaram sem resposta no cache.
+        multi = output_df[
+            output_df["custom_id"].str.startswith(f"task_req_{TICKER_MULTI}_", na=False)
+        ].drop_duplicates("hash_id", keep="last")
+        multi = multi.set_index("hash_id")[["decisao", "motivo"]]
+        em_cache = df["_merge"].eq("both")
+        falta = ~em_cache & df["hash_id"].isin(multi.index)
+        df.loc[falta, ["decisao", "motivo"]] = multi.loc[
+            df.loc[falta, "hash_id"]
+        ].to_numpy()
+        df = df[em_cache | falta].drop(columns=["_merge", "chave"])
+        logger.info(f"ticker={ticker} noticias_com_resposta={len(df)}")
 
         path = f"{STRATEGY_PATH}/{ticker}-completo.parquet"
         df.to_parquet(path)
@@ -145,131 +315,10 @@ class Pipeline:
 
         logger.info(f"ticker={ticker} salvo em {path}")
 
-    def plotar_retornos(self, ticker: str, df: pd.DataFrame):
-        df = df.set_index(["date"])
-
-        mask_long = df["mudanca"] == "LONG"
-        mask_short = df["mudanca"] == "SHORT"
-
-        df_long = df[mask_long]
-        df_short = df[mask_short]
-
-        fig = plt.figure(figsize=(18, 10), dpi=140)
-        gs = GridSpec(2, 1, height_ratios=[1.5, 0.5])
-        ax1 = fig.add_subplot(gs[0, 0])
-        ax2 = fig.add_subplot(gs[1, 0])
-
-        ax1.plot(df.index, df["dinheiro"], color="#377EB8", lw=2)
-        ax1.plot(df.index, df["bnh"], color="#2C3E50", ls="--", lw=2)
-        ax1.scatter(df_long.index, df_long["dinheiro"], s=50, zorder=5, color="#4DAF4A")
-        ax1.scatter(
-            df_short.index, df_short["dinheiro"], s=50, zorder=5, color="#E74C3C"
-        )
-
-        def get_color(x):
-            if x["retornos"] >= 0:
-                return "#4DAF4A"
-            return "#E74C3C"
-
-        df["color"] = df.apply(get_color, axis=1)
-        ax2.bar(df.index, df["retornos"], color=df["color"])
-
-        ax1.spines["right"].set_visible(False)
-        ax1.spines["top"].set_visible(False)
-        ax1.set_ylabel("Retorno (R$)")
-        ax1.set_xlabel("Data")
-
-        ax2.spines["right"].set_visible(False)
-        ax2.spines["top"].set_visible(False)
-        ax2.set_ylabel("Retorno (%)")
-        ax2.set_xlabel("Data")
-
-        plt.tight_layout()
-        fig.savefig(f"{GRAPH_PATH}/{ticker}.png")
-
-    def get_amount_of_shares(self, balance: float, open: float):
-        shares = math.floor(balance / open)
-        invested_value = shares * open
-        return shares, invested_value
-
     def backtest(self, ticker: str):
-        df = pd.read_parquet(f"{STRATEGY_PATH}/{ticker}.parquet")
-        data: list[Entry] = df.to_dict("records")
-
-        valor_inicial = 1000
-        balance = valor_inicial
-        print(f"Valor inicial: {balance}")
-
-        first_day = data[0]
-        current_position = first_day["posicao"]
-        current_shares, invested_value = (
-            self.get_amount_of_shares(balance, first_day["open"])
-            if current_position == "LONG"
-            else (0, 0)
-        )
-
-        balance -= invested_value
-
-        buy_n_hold = balance + invested_value
-        dinheiro = []
-        bnh = []
-        retornos = [0]
-        mudanca = [current_position]
-        posicoes = [current_position]
-
-        dinheiro.append(balance + invested_value)
-        bnh.append(buy_n_hold)
-
-        for entry in data[1:]:
-            todays_return = entry["open"] / entry["close"]
-            buy_n_hold = buy_n_hold * todays_return
-            mudanca_posicao = None
-
-            if current_position == Position.LONG:
-                invested_value = invested_value * todays_return
-
-            if entry["posicao"] == Position.SHORT and current_position in [
-                Position.LONG
-            ]:
-                balance += invested_value
-                invested_value = 0
-                current_shares = 0
-                mudanca_posicao = entry["posicao"]
-
-            if entry["posicao"] == Position.LONG and current_position in [
-                Position.SHORT,
-            ]:
-                current_shares, invested_value = self.get_amount_of_shares(
-                    balance, entry["open"]
-                )
-                balance -= invested_value
-                mudanca_posicao = entry["posicao"]
-
-            dinheiro.append(balance + invested_value)
-            bnh.append(buy_n_hold)
-            mudanca.append(mudanca_posicao)
-
-            retornos.append((dinheiro[-1] / valor_inicial) - 1)
-
-            if nova_posicao := entry.get("posicao"):
-                if nova_posicao != Position.UNKNOWN:
-                    current_position = entry["posicao"].strip()
-            posicoes.append(current_position)
-
-        balance += invested_value
-
-        logger.info(
-            f"ticker={ticker} valor_inicial={valor_inicial} valor_final={balance} buy_and_hold={buy_n_hold}"
-        )
-
-        df["dinheiro"] = dinheiro
-        df["bnh"] = bnh
-        df["mudanca"] = mudanca
-        df["retornos"] = retornos
-        df["retornos"] = 100 * df["retornos"]
-
-        df.to_parquet(f"{STRATEGY_PATH}/{ticker}-resultado.parquet")
-        self.plotar_retornos(ticker, df)
+        """Backtest completo do ticker pelo mesmo caminho do `backtesting.py`,
+        que grava o resultado e o estado usado pelo modo incremental."""
+        backtest(ticker)
 
 
 def main():
@@ -281,6 +330,7 @@ def main():
     news_df = pd.read_parquet(f"{CAMINHO_NOTICIAS}/vale3.parquet")
     p.reassamble_news(news_df, "vale3")
     p.backtest("vale3")
+    renderizar_graficos(["vale3"])
 
 
 if __name__ == "__main__":
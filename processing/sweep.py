@@ -0,0 +1,75 @@
+import datetime
+from multiprocessing import Pool
+
+import pandas as pd
+
+from backtest_engine import executar_backtest
+from config import STRATEGY_PATH
+from estrategia import METODOS_AGREGACAO
+from logs import get_logger
+from metricas import COLUNAS_RESULTADO, calcular_metricas
+from precos import get_armazem
+
+logger = get_logger()
+
+NUM_WORKERS = 16
+
+CHAVES_SWEEP = ("ticker", "metodo", "valor_inicial")
+
+
+def _executar_ticker(args: tuple[str, list[str], list[float]]) -> list[dict]:
+    ticker, metodos, capitais = args
+    precos = get_armazem().ler(ticker, colunas=["open", "close"])
+    noticias = pd.read_parquet(f"{STRATEGY_PATH}/{ticker}-completo.parquet")
+
+    execucoes = []
+    for metodo in metodos:
+        decisoes = METODOS_AGREGACAO[metodo](noticias.copy())
+        estrategia = pd.merge(precos, decisoes, on="date", how="left")
+
+        for valor_inicial in capitais:
+            df, _, _, _ = executar_backtest(estrategia.copy(), valor_inicial)
+            execucoes.append(
+                df[COLUNAS_RESULTADO].assign(
+                    ticker=ticker, metodo=metodo, valor_inicial=valor_inicial
+                )
+            )
+
+    resultados = calcular_metricas(
+        pd.concat(execucoes, ignore_index=True), CHAVES_SWEEP
+    ).to_dict("records")
+
+    logger.info(f"ticker={ticker} execucoes={len(resultados)}")
+    return resultados
+
+
+def executar_sweep(
+    tickers: list[str],
+    capitais: list[float],
+    metodos: list[str],
+    num_workers: int = NUM_WORKERS,
+) -> pd.DataFrame:
+    """Executa o backtest para cada combinação de ticker, valor inicial e
+    método de agregação em um pool de processos e salva uma tabela resumo."""
+
+    start = datetime.datetime.now()
+    # Constrói ou valida o armazém antes do pool; os workers herdam o mmap.
+    armazem = get_armazem()
+    logger.info(f"tickers={len(tickers)} linhas_de_preco={len(armazem.datas)}")
+
+    tarefas = [(ticker, metodos, capitais) for ticker in tickers]
+    with Pool(num_workers) as pool:
+        resultados = [
+            linha
+            for linhas in pool.imap_unordered(_executar_ticker, tarefas)
+            for linha in linhas
+        ]
+
+    resumo = pd.DataFrame(resultados).sort_values(list(CHAVES_SWEEP))
+    caminho = f"{STRATEGY_PATH}/sweep-{start:%Y%m%d%H%M%S}.parquet"
+    resumo.to_parquet(caminho, index=False)
+
+    logger.info(
+        f"execucoes={len(resumo)} tempo={datetime.datetime.now() - start} path={caminho}"
+    )
+    return resumo
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from backtest_engine import (
+    Position,
+    executar_backtest,
+    executar_backtest_iterativo,
+)
+
+SINAIS = [Position.LONG, Position.SHORT, Position.UNKNOWN, None, np.nan, ""]
+
+
+def get_df_estrategia(n: int, primeiro: str | None, semente: int) -> pd.DataFrame:
+    """Estratégia sintética no formato de `get_df_final`: preços aleatórios e
+    uma coluna posicao com lacunas (nulos, vazios e UNKNOWN)."""
+    rng = np.random.default_rng(semente)
+    fechamento = 20 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    abertura = fechamento * np.exp(rng.normal(0, 0.01, n))
+    posicao = rng.choice(np.array(SINAIS, dtype=object), n)
+    posicao[0] = primeiro
+    return pd.DataFrame(
+        {
+            "date": pd.date_range("2024-01-01", periods=n, freq="B"),
+            "open": abertura,
+            "close": fechamento,
+            "posicao": posicao,
+        }
+    )
+
+
+@pytest.mark.parametrize("primeiro", [Position.LONG, Position.SHORT, None])
+@pytest.mark.parametrize("semente", range(5))
+def test_motor_reproduz_loop_original(primeiro, semente):
+    df = get_df_estrategia(300, primeiro, semente)
+
+    esperado, valor_esperado, bnh_esperado = executar_backtest_iterativo(
+        df.copy(), 1000
+    )
+    obtido, valor_obtido, bnh_obtido, _ = executar_backtest(df.copy(), 1000)
+
+    pdt.assert_frame_equal(obtido, esperado, check_exact=True, check_dtype=False)
+    assert valor_obtido == valor_esperado
+    assert bnh_obtido == bnh_esperado
+
+
+def test_posicao_so_com_lacunas():
+    df = get_df_estrategia(50, None, 0)
+    df["posicao"] = np.nan
+
+    esperado, *_ = executar_backtest_iterativo(df.copy(), 1000)
+    obtido, *_ = executar_backtest(df.copy(), 1000)
+
+    pdt.assert_frame_equal(obtido, esperado, check_exact=True, check_dtype=False)
+    assert (obtido["dinheiro"] == 1000).all()
+
+
+@pytest.mark.parametrize("corte", [1, 37, 150, 299])
+def test_backtest_incremental_igual_ao_completo(corte):
+    df = get_df_estrategia(300, Position.LONG, 7)
+
+    completo, valor_completo, bnh_completo, estado_completo = executar_backtest(
+        df.copy(), 1000
+    )
+    inicio, _, _, estado = executar_backtest(df.iloc[:corte].copy(), 1000)
+    resto, valor, bnh, estado_final = executar_backtest(
+        df.iloc[corte:].copy(), 1000, estado
+    )
+
+    pdt.assert_frame_equal(
+        pd.concat([inicio, resto]), completo, check_exact=True, check_dtype=False
+    )
+    assert valor == valor_completo and bnh == bnh_completo
+    assert estado_final == estado_completo
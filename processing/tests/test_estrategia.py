@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from estrategia import agregar_decisoes, get_df_decisao_bm25, get_df_decisao_moda
+
+DECISOES = ["LONG", "SHORT", "UNKNOWN", None]
+
+
+def get_df_decisao_moda_original(df: pd.DataFrame):
+    """`get_df_decisao_moda` antes da agregação vetorizada."""
+    df["date"] = df["date"].apply(lambda x: x.date())
+    df["date"] = pd.to_datetime(df["date"])
+    df["date"] = df["date"].dt.tz_localize("America/Sao_Paulo")
+    com_decisao = (
+        df.groupby(by=["date", "decisao"])["decisao"]
+        .value_counts()
+        .groupby(level=0)
+        .idxmax()
+        .reset_index()
+    )
+
+    com_decisao["posicao"] = com_decisao["count"].apply(lambda x: x[1])
+    return com_decisao.drop(columns=["count"])
+
+
+def get_df_decisao_bm25_original(df: pd.DataFrame):
+    """`get_df_decisao_bm25` antes da agregação vetorizada."""
+    df["date"] = pd.to_datetime(df["date"]).dt.normalize()
+    df["date"] = df["date"].dt.tz_localize("America/Sao_Paulo")
+    df = df[df.decisao.isnull() == False]
+    com_decisao = (
+        df.groupby(by=["date", "decisao"])["bm25"]
+        .sum()
+        .groupby(level=0)
+        .idxmax()
+        .reset_index()
+    )
+
+    com_decisao["posicao"] = com_decisao["bm25"].apply(lambda x: x[1])
+    return com_decisao.drop(columns=["bm25"])
+
+
+def get_df_noticias(n: int, semente: int) -> pd.DataFrame:
+    """Notícias sintéticas em horários quaisquer de poucos dias, com decisões
+    nulas e pesos inteiros (alguns nulos), para que haja empates nas somas."""
+    rng = np.random.default_rng(semente)
+    inicio = pd.Timestamp("2024-01-01")
+    bm25 = rng.integers(0, 4, n).astype(float)
+    bm25[rng.random(n) < 0.1] = np.nan
+    return pd.DataFrame(
+        {
+            "date": inicio + pd.to_timedelta(rng.integers(0, 20 * 24 * 60, n), "min"),
+            "decisao": rng.choice(np.array(DECISOES, dtype=object), n),
+            "bm25": bm25,
+        }
+    )
+
+
+def comparar(resultado: pd.DataFrame, esperado: pd.DataFrame):
+    pdt.assert_frame_equal(
+        resultado.reset_index(drop=True),
+        esperado.reset_index(drop=True),
+        check_dtype=False,
+        check_index_type=False,
+    )
+
+
+@pytest.mark.parametrize("semente", range(5))
+def test_moda_reproduz_original(semente):
+    df = get_df_noticias(300, semente)
+    comparar(get_df_decisao_moda(df.copy()), get_df_decisao_moda_original(df.copy()))
+
+
+@pytest.mark.parametrize("semente", range(5))
+def test_bm25_reproduz_original(semente):
+    df = get_df_noticias(300, semente)
+    comparar(get_df_decisao_bm25(df.copy()), get_df_decisao_bm25_original(df.copy()))
+
+
+def test_empate_vence_primeira_em_ordem_alfabetica():
+    df = pd.DataFrame(
+        {
+            "date": pd.to_datetime(
+                ["2024-01-02 10:00", "2024-01-02 15:00", "2024-01-02 18:00"]
+                + ["2024-01-03 09:00", "2024-01-03 11:00"]
+            ),
+            "decisao": ["UNKNOWN", "SHORT", None, "SHORT", "LONG"],
+            "bm25": [2.0, 2.0, 5.0, 1.0, 1.0],
+        }
+    )
+
+    moda = get_df_decisao_moda(df.copy())
+    bm25 = get_df_decisao_bm25(df.copy())
+    assert moda["posicao"].tolist() == ["SHORT", "LONG"]
+    assert bm25["posicao"].tolist() == ["SHORT", "LONG"]
+    comparar(moda, get_df_decisao_moda_original(df.copy()))
+    comparar(bm25, get_df_decisao_bm25_original(df.copy()))
+
+
+def test_agregar_decisoes_sem_normalizar_agrupa_por_data():
+    datas = pd.Series(pd.to_datetime(["2024-01-02 10:00", "2024-01-02 15:00"]))
+    resultado = agregar_decisoes(datas, pd.Series(["SHORT", "LONG"]))
+    assert resultado["posicao"].tolist() == ["SHORT", "LONG"]
@@ -0,0 +1,62 @@
+import importlib
+import re
+import sys
+
+import nltk
+import pandas as pd
+import pytest
+from nltk.tokenize.destructive import NLTKWordTokenizer
+
+# Amostra das stopwords do nltk, para o teste não depender do download.
+STOPWORDS = ["a", "o", "de", "e", "que", "não", "em", "um", "para", "com", "é", "às"]
+
+TEXTOS = [
+    "",
+    "   ",
+    "!!! ... ???",
+    "Vale3: lucro sobe 10%, diz CEO!",
+    "O Banco do Brasil (BBAS3) paga R$ 1.234,56 em dividendos às 10h.",
+    "\"Petrobras\" diz “não” e «talvez» ao acordo; 'preço' cai",
+    "I cannot go, you gonna see, he wanna gotta",
+    "Lemme gimme more, 'tis 'twas d'ye morra",
+    "CANNOT Gonna WANNA",
+    "ação_preferencial\tsubiu\nmuito   hoje",
+    "É a maior alta em 3 anos — não é pouco…",
+]
+
+
+class StopwordsFalsas:
+    def words(self, idioma: str) -> list[str]:
+        return STOPWORDS
+
+
+@pytest.fixture(scope="module")
+def utils():
+    """Importa `utils` sem baixar dados do nltk."""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(nltk, "download", lambda *args, **kwargs: True)
+        mp.setattr(nltk.corpus, "stopwords", StopwordsFalsas())
+        mp.delitem(sys.modules, "utils", raising=False)
+        yield importlib.import_module("utils")
+
+
+def pre_processing_nltk(content: str) -> str:
+    """Caminho original: regex, minúsculas e o tokenizador do nltk. Sem
+    pontuação, o word_tokenize não separa frases e se reduz ao
+    NLTKWordTokenizer."""
+    content = re.sub(r"[^\w\s]", "", content).lower()
+    return " ".join(
+        w for w in NLTKWordTokenizer().tokenize(content) if w not in STOPWORDS
+    )
+
+
+@pytest.mark.parametrize("texto", TEXTOS)
+def test_pre_processing_reproduz_nltk(utils, texto):
+    assert utils.pre_processing(texto) == pre_processing_nltk(texto)
+
+
+def test_pre_processing_lote_reproduz_nltk(utils):
+    textos = pd.Series(TEXTOS + TEXTOS[::-1])
+    assert utils.pre_processing_lote(textos) == [
+        pre_processing_nltk(texto) for texto in textos
+    ]
@@ -0,0 +1,133 @@
+import json
+import time
+from typing import Iterable
+
+import numpy as np
+import tiktoken
+from decouple import config
+
+from config import MODELO
+from logs import get_logger
+
+logger = get_logger()
+
+# Encoding usado quando o tiktoken não conhece o modelo.
+ENCODING_PADRAO = "o200k_base"
+
+# Limite de tokens do texto da notícia no USER_PROMPT; o excedente é cortado.
+MAX_TOKENS_NOTICIA: int = config("MAX_TOKENS_NOTICIA", default=1024, cast=int)
+
+# Tokens fixos que a API acrescenta por mensagem e para iniciar a resposta.
+TOKENS_POR_MENSAGEM = 3
+TOKENS_RESPOSTA = 3
+
+# Média de caracteres por token das contagens estimadas (ver `contar_tokens`).
+CARACTERES_POR_TOKEN = 4
+
+# Segundos até tentar de novo carregar um encoding que falhou.
+NOVA_TENTATIVA_ENCODING = 60
+
+_encodings: dict[str, tiktoken.Encoding] = {}
+_falhas: dict[str, tuple[float, Exception]] = {}
+
+
+def get_encoding(modelo: str = MODELO) -> tiktoken.Encoding:
+    """Encoding do modelo. O tiktoken baixa o arquivo do encoding no primeiro
+    uso, ou o lê de TIKTOKEN_CACHE_DIR. Uma falha é lembrada por
+    NOVA_TENTATIVA_ENCODING segundos e depois o carregamento é tentado de novo."""
+    if modelo in _encodings:
+        return _encodings[modelo]
+
+    falha = _falhas.get(modelo)
+    if falha is None or time.monotonic() - falha[0] >= NOVA_TENTATIVA_ENCODING:
+        try:
+            try:
+                _encodings[modelo] = tiktoken.encoding_for_model(modelo)
+            except KeyError:
+                _encodings[modelo] = tiktoken.get_encoding(ENCODING_PADRAO)
+            _falhas.pop(modelo, None)
+            return _encodings[modelo]
+        except Exception as err:
+            logger.warning(f"status=encoding_indisponivel modelo={modelo} erro={err}")
+            falha = _falhas[modelo] = (time.monotonic(), err)
+
+    raise RuntimeError(
+        f"Encoding do tiktoken indisponível para {modelo}. Sem acesso à rede, "
+        "aponte TIKTOKEN_CACHE_DIR para um diretório com o encoding já baixado."
+    ) from falha[1]
+
+
+def contar_tokens(textos: Iterable[str], estimar: bool = False) -> np.ndarray:
+    """Quantidade de tokens de cada texto, codificados em lote. Com `estimar`,
+    se o encoding não puder ser carregado, a contagem é estimada pelo tamanho
+    do texto (CARACTERES_POR_TOKEN) em vez de falhar."""
+    textos = list(textos)
+    try:
+        encoding = get_encoding()
+    except RuntimeError:
+        if not estimar:
+            raise
+        return np.fromiter(
+            (-(-len(texto) // CARACTERES_POR_TOKEN) for texto in textos),
+            dtype=np.int64,
+            count=len(textos),
+        )
+
+    tokens = encoding.encode_ordinary_batch(textos)
+    return np.fromiter((len(t) for t in tokens), dtype=np.int64, count=len(tokens))
+
+
+def truncar(textos: Iterable[str], limite: int = MAX_TOKENS_NOTICIA) -> list[str]:
+    """Corta cada texto nos primeiros `limite` tokens. Textos dentro do limite
+    são devolvidos sem alteração. Como cada token tem ao menos um caractere,
+    textos com até `limite` caracteres nem passam pelo encoding; os demais
+    exigem o encoding real, e o corte nunca é estimado."""
+    textos = list(textos)
+    longos = [i for i, texto in enumerate(textos) if len(texto) > limite]
+    if not longos:
+        return textos
+
+    encoding = get_encoding()
+    tokens = encoding.encode_ordinary_batch([textos[i] for i in longos])
+    for i, t in zip(longos, tokens):
+        if len(t) > limite:
+            textos[i] = encoding.decode(t[:limite])
+    return textos
+
+
+def tokens_fixos(
+    system_prompt: str, response_format: dict, estimar: bool = False
+) -> int:
+    """Tokens de entrada comuns a todas as requisições com o mesmo system prompt
+    e schema de resposta: tudo menos o conteúdo da mensagem do usuário."""
+    schema = json.dumps(response_format, ensure_ascii=False)
+    return (
+        int(contar_tokens([system_prompt, schema], estimar).sum())
+        + 2 * TOKENS_POR_MENSAGEM
+        + TOKENS_RESPOSTA
+    )
+
+
+def tokens_requisicoes(
+    system_prompt: str,
+    response_format: dict,
+    user_prompts: list[str],
+    estimar: bool = False,
+) -> np.ndarray:
+    """Tokens de entrada de cada requisição com o mesmo system prompt e schema,
+    contando só os user prompts um a um."""
+    return tokens_fixos(system_prompt, response_format, estimar) + contar_tokens(
+        user_prompts, estimar
+    )
+
+
+def tokens_task(task: dict, estimar: bool = False) -> int:
+    """Tokens de entrada de uma task de batch já montada."""
+    body = task["body"]
+    mensagens = [m["content"] for m in body["messages"]]
+    schema = json.dumps(body.get("response_format", {}), ensure_ascii=False)
+    return (
+        int(contar_tokens(mensagens + [schema], estimar).sum())
+        + TOKENS_POR_MENSAGEM * len(mensagens)
+        + TOKENS_RESPOSTA
+    )
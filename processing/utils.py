@@ -1,23 +1,42 @@
 import re
+from typing import Iterable
+
 from nltk.corpus import stopwords
 from nltk import download
-from nltk.tokenize import word_tokenize
+from nltk.tokenize.destructive import NLTKWordTokenizer
 import holidays
 
 download("stopwords")
-download("punkt_tab")
 pt_stopwords = stopwords.words("portuguese")
 
+STOPWORDS = frozenset(pt_stopwords)
+PONTUACAO = re.compile(r"[^\w\s]")
+
+# Depois que a pontuação é removida, o word_tokenize não encontra fim de frase
+# e o tokenizador treebank só separa as contrações do inglês ("cannot",
+# "gonna", ...) antes de dividir pelos espaços. Aplicar as mesmas regex e
+# dividir direto dá os mesmos tokens, sem as demais etapas do nltk.
+CONTRACOES = NLTKWordTokenizer.CONTRACTIONS2 + NLTKWordTokenizer.CONTRACTIONS3
+
 
 def pre_processing(content: str):
-    content = re.sub(r"[^\w\s]", "", content).lower()
-    return " ".join(
-        [
-            w
-            for w in word_tokenize(content, language="portuguese")
-            if w not in pt_stopwords
-        ]
-    )
+    content = f" {PONTUACAO.sub('', content).lower()} "
+    for regex in CONTRACOES:
+        content = regex.sub(r" \1 \2 ", content)
+    return " ".join([w for w in content.split() if w not in STOPWORDS])
+
+
+def pre_processing_lote(conteudos: Iterable[str]) -> list[str]:
+    """`pre_processing` de cada texto, com os mesmos tokens, em uma passada.
+    Textos repetidos são processados uma única vez."""
+    memo: dict[str, str] = {}
+    resultado = []
+    for conteudo in conteudos:
+        tratado = memo.get(conteudo)
+        if tratado is None:
+            tratado = memo[conteudo] = pre_processing(conteudo)
+        resultado.append(tratado)
+    return resultado
 
 
 br_holidays = holidays.BR()